@@ -0,0 +1,177 @@
+import math
+import os
+import threading
+import time
+
+from cf_client import default_client
+from run_trace import tracer
+
+# 上限仍是 10MB / 30s, 但大多数 IP 在收敛或确定进不了前 50 时就提前停止
+MAX_BYTES = 10485760
+MAX_SECONDS = 30
+
+WINDOW_SECONDS = 0.05  # 采样窗口
+WARMUP_SECONDS = 0.15  # 去掉 TCP 慢启动阶段 (下限, 本机/低延迟链路用这个值)
+MIN_WINDOWS = 4
+# 慢启动每个 RTT 窗口翻倍, 从初始窗口涨到跑满带宽要若干个 RTT; 高延迟链路按 RTT 放长预热和稳态观察期,
+# 否则 150ms+ 的链路在慢启动中就被判为收敛 (或低于门槛), 得到偏低的速度
+WARMUP_RTTS = 8
+STEADY_RTTS = 4  # 稳态阶段至少覆盖这么多个 RTT 才判断收敛/提前停止
+REL_TOLERANCE = 0.10  # 95% 置信区间半宽 / 估计值 小于此值即认为收敛
+
+# 上传测速的请求体: 同一块随机数据反复发送 (chunked 编码, 可随时结束), 每个上传只占这 64KB
+UPLOAD_CHUNK = memoryview(os.urandom(65536))
+
+
+class TopCutoff:
+    """线程安全地跟踪当前第 n 名的值 (速度或综合评分), 不足 n 个结果时门槛为 0"""
+
+    def __init__(self, n=50):
+        self.n = n
+        self.speeds = []
+        self.lock = threading.Lock()
+
+    def add(self, value):
+        with self.lock:
+            self.speeds.append(value)
+            self.speeds.sort(reverse=True)
+            del self.speeds[self.n:]
+
+    def value(self):
+        with self.lock:
+            return self.speeds[-1] if len(self.speeds) >= self.n else 0.0
+
+
+def _estimate(windows, steady_bytes, steady_seconds):
+    """返回 (稳态速度 MB/s, 95% 置信区间半宽 MB/s)"""
+    speed = steady_bytes / steady_seconds / 1048576 if steady_seconds > 0 else 0.0
+    if len(windows) < 2:
+        return speed, float('inf')
+    mean = sum(windows) / len(windows)
+    var = sum((w - mean) ** 2 for w in windows) / (len(windows) - 1)
+    return speed, 1.96 * math.sqrt(var / len(windows))
+
+
+class ThroughputMeter:
+    """按时间窗口采样一个字节流的吞吐; 每传完一块调用 add(), 返回非 None 的停止原因时应停止传输
+
+    下载时由读循环调用, 上传时由请求体生成器在每块发出后调用。
+    """
+
+    def __init__(self, cutoff=0.0, max_bytes=MAX_BYTES, max_seconds=MAX_SECONDS, rtt=0.0):
+        """rtt 为往返时间秒数 (未知时为 0), 用来放长预热和最短稳态时间"""
+        self.cutoff = cutoff
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.warmup = min(max(WARMUP_SECONDS, WARMUP_RTTS * rtt), max_seconds / 4)
+        self.min_steady = max(MIN_WINDOWS * WINDOW_SECONDS, STEADY_RTTS * rtt)
+        self.started = time.monotonic()
+        self.total = 0
+        self.windows = []  # 稳态阶段每个窗口的 MB/s
+        self.window_start, self.window_bytes = None, 0
+        self.steady_bytes, self.steady_started = 0, None
+        self.reason = 'eof'
+        self.speed = 0.0
+
+    def add(self, size):
+        now = time.monotonic()
+        self.total += size
+        elapsed = now - self.started
+        if elapsed < self.warmup:
+            self.window_start = now
+        elif self.steady_started is None:
+            self.steady_started, self.window_start = now, now
+        else:
+            self.steady_bytes += size
+            self.window_bytes += size
+            if now - self.window_start >= WINDOW_SECONDS:
+                self.windows.append(self.window_bytes / (now - self.window_start) / 1048576)
+                self.window_start, self.window_bytes = now, 0
+                self.speed, half_width = _estimate(self.windows, self.steady_bytes, now - self.steady_started)
+                if len(self.windows) >= MIN_WINDOWS and now - self.steady_started >= self.min_steady:
+                    if half_width <= self.speed * REL_TOLERANCE:
+                        self.reason = 'converged'
+                        return self.reason
+                    if self.cutoff > 0 and self.speed + half_width < self.cutoff:
+                        self.reason = 'below_cutoff'
+                        return self.reason
+        if self.total >= self.max_bytes:
+            self.reason = 'max_bytes'
+            return self.reason
+        if elapsed >= self.max_seconds:
+            self.reason = 'max_seconds'
+            return self.reason
+        return None
+
+    def result(self):
+        """{'speed': MB/s, 'bytes': 总字节, 'seconds': 总秒数, 'reason': 停止原因}"""
+        seconds = time.monotonic() - self.started
+        speed = self.speed
+        if not self.windows:
+            # 传输太短没进入稳态 (极快或极慢), 退回整体平均
+            speed = self.total / seconds / 1048576 if seconds > 0 else 0.0
+        return {'speed': round(speed, 1), 'bytes': self.total, 'seconds': round(seconds, 2), 'reason': self.reason}
+
+
+def measure_stream(chunks, cutoff=0.0, max_bytes=MAX_BYTES, max_seconds=MAX_SECONDS, rtt=0.0):
+    """按时间窗口采样一个字节流的吞吐, 收敛或确定低于 cutoff 时提前停止 (预热时长随 rtt 秒放长)
+
+    chunks 为产出每次读到字节数的迭代器。返回
+    {'speed': MB/s, 'bytes': 总字节, 'seconds': 总秒数, 'reason': 停止原因}
+    """
+    meter = ThroughputMeter(cutoff, max_bytes, max_seconds, rtt)
+    for size in chunks:
+        if meter.add(size) is not None:
+            break
+    return meter.result()
+
+
+def measure_download(ip, port=443, cutoff=0.0, max_bytes=MAX_BYTES, max_seconds=MAX_SECONDS, client=None, rtt=None):
+    """通过固定 IP 流式下载 __down 并自适应测速, 结果附带分阶段耗时
+
+    rtt 为已测得的往返时间秒数 (如延迟探测的 p50); 不传时用本次请求的首字节时间代替。
+    """
+    client = client or default_client
+    with client.request(ip, port, f'/__down?bytes={max_bytes}') as resp:
+        if resp.status != 200:
+            raise OSError(f'HTTP {resp.status}')
+        rtt = resp.timings['ttfb'] if rtt is None else rtt
+        result = measure_stream((len(chunk) for chunk in resp.iter_chunks()), cutoff, max_bytes, max_seconds, rtt)
+        result['timings'] = dict(resp.timings, transfer=result['seconds'])
+    timings = result['timings']
+    if timings['reused']:
+        tracer.count('speed.reused_connection')
+    else:
+        tracer.record('speed.connect', timings['connect'], ip=ip)
+        tracer.record('speed.tls', timings['tls'], ip=ip)
+    tracer.record('speed.ttfb', timings['ttfb'], ip=ip)
+    tracer.record('speed.transfer', timings['transfer'], ip=ip, bytes=result['bytes'], reason=result['reason'])
+    tracer.count(f"speed.stop.{result['reason']}")
+    return result
+
+
+def measure_upload(ip, port=443, cutoff=0.0, max_bytes=MAX_BYTES, max_seconds=MAX_SECONDS, client=None, rtt=0.0):
+    """通过固定 IP 向 __up 流式上传并自适应测速 (预热、窗口采样、提前停止与下载相同, rtt 为往返时间秒数)
+
+    计时点是每块交给内核之后; 发送缓冲区在预热阶段就会填满, 稳态窗口反映的是实际上行速度。
+    """
+    client = client or default_client
+    meters = []
+
+    def body():
+        meter = ThroughputMeter(cutoff, max_bytes, max_seconds, rtt)  # 从开始发送请求体计时, 不含握手
+        meters.append(meter)
+        while True:
+            yield UPLOAD_CHUNK
+            if meter.add(len(UPLOAD_CHUNK)) is not None:
+                return  # 结束 chunked 请求体, 服务端收到完整请求后回 200, 连接可复用
+
+    with client.request(ip, port, '/__up', method='POST', body=body(),
+                        headers={'Content-Type': 'application/octet-stream'}) as resp:
+        resp.read()
+        if resp.status != 200:
+            raise OSError(f'HTTP {resp.status}')
+    result = meters[-1].result()
+    tracer.record('speed.upload', result['seconds'], ip=ip, bytes=result['bytes'], reason=result['reason'])
+    tracer.count(f"speed.upload_stop.{result['reason']}")
+    return result
@@ -1,36 +1,16 @@
-import requests
-import re
 import os
 import time
-import ipaddress
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options
+from concurrent.futures import ThreadPoolExecutor
+from browser_pool import BrowserPool
+from feed_fetcher import DYNAMIC_URLS, FEED_URLS, fetch_all
+from ip_extract import extract_stream
+from ipset import IPSet
+from geo_batch import IPINFO_RATE, TokenBucket, ipinfo_country_code, lookup_country_codes
+from geo_index import load_default_index
+from run_trace import tracer
 
-# 目标URL列表
-urls = [
-    'https://raw.githubusercontent.com/ymyuuu/IPDB/main/BestCF/bestcfv4.txt',
-    'https://raw.githubusercontent.com/rong2er/IP666/refs/heads/main/Ranking.txt',
-    'https://raw.githubusercontent.com/gslege/CloudflareIP/refs/heads/main/SG.txt',
-    'https://raw.githubusercontent.com/gslege/CloudflareIP/refs/heads/main/JP.txt',
-    'https://raw.githubusercontent.com/gslege/CloudflareIP/refs/heads/main/DE.txt',
-    'https://raw.githubusercontent.com/gslege/CloudflareIP/refs/heads/main/NL.txt'
-    #'https://www.wetest.vip/page/cloudflare/address_v6.html',
-    #'https://www.wetest.vip/page/cloudflare/address_v4.html',
-    #'https://cf.090227.xyz',
-    #'https://api.uouin.com/cloudflare.html',
-    #'https://ipdb.api.030101.xyz/?type=bestcf&country=true',
-    #'https://addressesapi.090227.xyz/CloudFlareYes',
-]
-
-# 正则表达式用于初步匹配IPV4与IPV6地址(配合ipaddress库二次过滤)
-ipv4_pattern = r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b'
-# 新版IPv6 pattern: 支持压缩格式(如::), 大/小写
-ipv6_pattern = r'(?:(?:[0-9A-Fa-f]{1,4}:){6}(?:[0-9A-Fa-f]{1,4}|(?<=:)[0-9A-Fa-f]{0,4})|(?:[0-9A-Fa-f]{1,4}:){5}(?::[0-9A-Fa-f]{1,4}){1,2}|(?:[0-9A-Fa-f]{1,4}:){4}(?::[0-9A-Fa-f]{1,4}){1,3}|(?:[0-9A-Fa-f]{1,4}:){3}(?::[0-9A-Fa-f]{1,4}){1,4}|(?:[0-9A-Fa-f]{1,4}:){2}(?::[0-9A-Fa-f]{1,4}){1,5}|(?:[0-9A-Fa-f]{1,4}:){1}(?::[0-9A-Fa-f]{1,4}){1,6}|(?::(?::[0-9A-Fa-f]{1,4}){1,7}|:)|(?:[0-9A-Fa-f]{1,4}:)(?::[0-9A-Fa-f]{1,4}){0,6})'
+# 目标URL列表 (定义在 feed_fetcher.py, 可用环境变量 AUTOIP6_URLS 替换)
+urls = FEED_URLS
 
 # 检查ip.txt和ipv6.txt文件是否存在,如果存在则删除它
 if os.path.exists('ip.txt'):
@@ -38,131 +18,94 @@ if os.path.exists('ip.txt'):
 if os.path.exists('ipv6.txt'):
     os.remove('ipv6.txt')
 
-# 使用集合存储IP地址实现自动去重
-unique_ipv4 = set()
-unique_ipv6 = set()
-
-def setup_selenium():
-    # 设置无头Chrome浏览器
-    chrome_options = 选项()
-    chrome_options.add_argument("--headless")  # 无头模式,适合Actions
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    return driver
+# 使用整数数组存储IP地址, 最后统一数值排序去重
+collected = IPSet()
 
-for url in urls:
-    try:
-        if url == 'https://ip.164746.xyz':  # 针对动态站点用Selenium
-            print(f'Using Selenium for dynamic site: {url}')
-            driver = setup_selenium()
-            driver.get(url)
-            # 等待动态加载(调整时间或加按钮点击)
-            time.sleep(10)  # 等待JS加载IP
-            html_content = driver.page_source
-            driver.quit()
-        else:  # 其他URL用requests(添加no-cache headers)
-            # 随机化URL避免缓存(可选,针对频繁更新站点)
-            if 'wetest.vip' in url:
-                url_with_cache_bust = f"{url}?t={int(time.time())}"
-            else:
-                url_with_cache_bust = url
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Cache-Control': 'no-cache',
-                'Pragma': 'no-cache',
-                'If-None-Match': ''  # 清ETag缓存
-            }
-            response = requests.get(url_with_cache_bust, headers=headers, timeout=7)
-            if response.status_code == 200:
-                html_content = response.text
-                # 调试: 打印响应头,检查缓存状态
-                print(f'{url} Cache-Control header: {response.headers.get("Cache-Control", "none")}')
-            else:
-                print(f'Request failed for {url}: status {response.status_code}')
-                continue
+def extract_ips(chunks):
+    """单遍扫描文本块(可流式), 返回去重后的(ipv4整数列表, ipv6整数列表)"""
+    ipv4_ints, ipv6_ints = extract_stream(chunks)
+    return sorted(set(ipv4_ints)), sorted(set(ipv6_ints))
 
-        # 确保内容获取(对Selenium也检查)
-        if 'html_content' in locals() and len(html_content) > 100:  # 过滤空内容
-            # 使用正则表达式查找IP地址
-            ipv4_matches = re.findall(ipv4_pattern, html_content)
-            ipv6_matches = re.findall(ipv6_pattern, html_content)
-            
-            # 用ipaddress校验并去重
-            valid_ipv4 = []
-            for ip in ipv4_matches:
-                try:
-                    ipaddress.IPv4Address(ip)
-                    unique_ipv4.add(ip)
-                    valid_ipv4.append(ip)
-                except ValueError:
-                    continue
-            valid_ipv6 = []
-            for ip in ipv6_matches:
-                try:
-                    ipaddress.IPv6Address(ip)
-                    unique_ipv6.add(ip.lower())
-                    valid_ipv6.append(ip)
-                except ValueError:
-                    continue
-            print(f'From {url} extracted: {len(ipv4_matches)} IPv4 candidates, {len(ipv6_matches)} IPv6 candidates (valid: {len(valid_ipv4)} IPv4, {len(valid_ipv6)} IPv6)')
-            # 针对wetest.vip, 提取更新时间戳调试
-            if 'wetest.vip' in url:
-                timestamp_pattern = r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})'
-                timestamps = re.findall(timestamp_pattern, html_content)
-                if timestamps:
-                    latest_ts = max(timestamps)
-                    print(f'{url} latest update time: {latest_ts} (current time: {time.strftime("%Y-%m-%d %H:%M:%S")})')
+def collect_dynamic(urls):
+    """所有动态站点共用一个无头Chrome, 在标签页中同时加载, 页面就绪即读取; 返回 [(url, ipv4列表, ipv6列表)]"""
+    print(f'Using Selenium for {len(urls)} dynamic sites')
+    results = []
+    with BrowserPool() as pool:
+        pages = pool.fetch_all(urls)
+    for url, html_content in pages.items():
+        if len(html_content) > 100:  # 过滤空内容
+            with tracer.span('extract', url=url):
+                ipv4_list, ipv6_list = extract_ips([html_content])
+            print(f'From {url} extracted: {len(ipv4_list)} IPv4, {len(ipv6_list)} IPv6 (dynamic)')
+            results.append((url, ipv4_list, ipv6_list))
         else:
             print(f'{url} content empty or too short, skipping')
-    except Exception as e:  # 捕获Selenium/requests错误
-        print(f'Failed to process {url}: {e}')
-        continue
+    return results
 
-# 调试: 打印最终unique大小
-print(f'Total unique IPv4: {len(unique_ipv4)}, IPv6: {len(unique_ipv6)}')
+dynamic_urls = [url for url in urls if url in DYNAMIC_URLS]
+static_urls = [url for url in urls if url not in DYNAMIC_URLS]
 
-# 查询每个IP的country_code
-def get_country_code(ip):
+# 动态站点在后台线程中渲染, 与静态源抓取同时进行
+dynamic_executor = ThreadPoolExecutor(max_workers=1)
+dynamic_future = dynamic_executor.submit(collect_dynamic, dynamic_urls) if dynamic_urls else None
+
+# 所有静态源并发抓取(共享连接池 + ETag/Last-Modified条件请求, 304直接复用缓存IP)
+fetch_started = time.time()
+with tracer.span('stage.fetch', sources=len(static_urls)):
+    fetch_results = fetch_all(static_urls, extract_ips)
+for result in fetch_results:
+    url = result['url']
+    if 'error' in result:
+        print(f'Failed to process {url}: {result["error"]}')
+        continue
+    if result['status'] == 304:
+        print(f'{url} not modified (304), reused {len(result["ipv4"])} IPv4, {len(result["ipv6"])} IPv6 from cache ({result["elapsed"]:.2f}s)')
+    elif result['status'] != 200:
+        print(f'Request failed for {url}: status {result["status"]}')
+        continue
+    elif result['bytes'] <= 100:
+        print(f'{url} content empty or too short, skipping')
+        continue
+    else:
+        print(f'From {url} extracted: {len(result["ipv4"])} IPv4, {len(result["ipv6"])} IPv6 ({result["bytes"]} bytes, {result["elapsed"]:.2f}s)')
+    collected.add_v4(result['ipv4'])
+    collected.add_v6(result['ipv6'])
+print(f'Fetched {len(static_urls)} sources in {time.time() - fetch_started:.2f}s')
+
+if dynamic_future is not None:
     try:
-        url = f'https://api.ipinfo.io/lite/{ip}?token=6f75ff6b8f013b'
-        resp = requests.get(url, timeout=5)
-        if resp.status_code == 200:
-            data = resp.json()
-            return data.get('country_code') or data.get('country') or 'ZZ'
-        else:
-            return 'ZZ'
-    except Exception as e:
-        print(f"Failed to query country_code for IP {ip}: {e}")
-        return 'ZZ'
+        with tracer.span('stage.dynamic', sources=len(dynamic_urls)):
+            dynamic_results = dynamic_future.result()
+        for url, ipv4_list, ipv6_list in dynamic_results:
+            collected.add_v4(ipv4_list)
+            collected.add_v6(ipv6_list)
+    except Exception as e:  # 捕获Selenium错误 (如浏览器启动失败)
+        print(f'Failed to process dynamic sites: {e}')
+        tracer.count('dynamic.error')
+dynamic_executor.shutdown()
+
+with tracer.span('stage.dedupe'):
+    collected.normalize()
+print(f'Total unique IPv4: {len(collected.v4)} ({len(collected.ipv4_cidrs())} CIDR blocks), IPv6: {len(collected.v6_hi)} ({len(collected.ipv6_cidrs())} CIDR blocks)')
+
+# 先排序, 再一次性批量查询国家码(离线库 → 缓存 → ip-api批量 → ipinfo逐个兜底, 令牌桶限速)
+sorted_ipv4 = collected.ipv4_strings()
+sorted_ipv6 = collected.ipv6_strings()
+with tracer.span('stage.geo', ips=len(sorted_ipv4) + len(sorted_ipv6)):
+    country_codes = lookup_country_codes(sorted_ipv4 + sorted_ipv6, fallback=ipinfo_country_code, fallback_bucket=TokenBucket(rate=IPINFO_RATE, capacity=5), index=load_default_index())
 
 # IPv4处理(即使空也写空文件)
-sorted_ipv4 = sorted(unique_ipv4, key=lambda ip: [int(part) for part in ip.split('.')])
-results_v4 = []
-for ip in sorted_ipv4:
-    country_code = get_country_code(ip)
-    results_v4.append(f"{ip}:8443#{country_code}")
-    time.sleep(1)
-with open('ip.txt', 'w', encoding='utf-8') as file:
-    for line in results_v4:
-        file.write(line + '\n')
-print(f'Saved {len(results_v4)} unique IPv4 addresses with country_code to ip.txt.')
-print(f'ip.txt size: {os.path.getsize("ip.txt") if os.path.exists("ip.txt") else 0} bytes')  # 调试大小
+results_v4 = [f"{ip}:8443#{country_codes[ip]}" for ip in sorted_ipv4]
+with tracer.span('stage.write', path='ip.txt', lines=len(results_v4)):
+    with open('ip.txt', 'w', encoding='utf-8') as file:
+        for line in results_v4:
+            file.write(line + '\n')
+print(f'Saved {len(results_v4)} unique IPv4 addresses with country_code to ip.txt ({os.path.getsize("ip.txt")} bytes).')
 
 # IPv6处理(即使空也写空文件)
-sorted_ipv6 = sorted(unique_ipv6)
-results_v6 = []
-for ip in sorted_ipv6:
-    country_code = get_country_code(ip)
-    results_v6.append(f"[{ip}]:8443#{country_code}-IPV6")
-    time.sleep(1)
-with open('ipv6.txt', 'w', encoding='utf-8') as file:
-    for line in results_v6:
-        file.write(line + '\n')
-print(f'Saved {len(results_v6)} unique IPv6 addresses with country_code to ipv6.txt.')
-print(f'ipv6.txt size: {os.path.getsize("ipv6.txt") if os.path.exists("ipv6.txt") else 0} bytes')  # 调试大小
-
-# 最终调试: 列出当前目录文件
-print(f'Current directory: {os.getcwd()}')
-print(f'Directory files: {os.listdir(".")}')
+results_v6 = [f"[{ip}]:8443#{country_codes[ip]}-IPV6" for ip in sorted_ipv6]
+with tracer.span('stage.write', path='ipv6.txt', lines=len(results_v6)):
+    with open('ipv6.txt', 'w', encoding='utf-8') as file:
+        for line in results_v6:
+            file.write(line + '\n')
+print(f'Saved {len(results_v6)} unique IPv6 addresses with country_code to ipv6.txt ({os.path.getsize("ipv6.txt")} bytes).')
@@ -0,0 +1,84 @@
+"""IP 提取基准: 旧版(两个正则 + ipaddress 逐个校验) 对比 ip_extract 单遍扫描
+
+用法:
+    python bench_extract.py              # 默认 1MB / 4MB / 16MB
+    python bench_extract.py --sizes 8 32
+"""
+import argparse
+import ipaddress
+import random
+import re
+import time
+
+from ip_extract import extract_ints, extract_stream, ipv4_to_str, ipv6_to_str
+
+# 旧版 autoip6.py 中的实现, 作为对照
+ipv4_pattern = r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b'
+ipv6_pattern = r'(?:(?:[0-9A-Fa-f]{1,4}:){6}(?:[0-9A-Fa-f]{1,4}|(?<=:)[0-9A-Fa-f]{0,4})|(?:[0-9A-Fa-f]{1,4}:){5}(?::[0-9A-Fa-f]{1,4}){1,2}|(?:[0-9A-Fa-f]{1,4}:){4}(?::[0-9A-Fa-f]{1,4}){1,3}|(?:[0-9A-Fa-f]{1,4}:){3}(?::[0-9A-Fa-f]{1,4}){1,4}|(?:[0-9A-Fa-f]{1,4}:){2}(?::[0-9A-Fa-f]{1,4}){1,5}|(?:[0-9A-Fa-f]{1,4}:){1}(?::[0-9A-Fa-f]{1,4}){1,6}|(?::(?::[0-9A-Fa-f]{1,4}){1,7}|:)|(?:[0-9A-Fa-f]{1,4}:)(?::[0-9A-Fa-f]{1,4}){0,6})'
+
+
+def legacy_extract(text):
+    unique_ipv4, unique_ipv6 = set(), set()
+    for ip in re.findall(ipv4_pattern, text):
+        try:
+            ipaddress.IPv4Address(ip)
+            unique_ipv4.add(ip)
+        except ValueError:
+            continue
+    for ip in re.findall(ipv6_pattern, text):
+        try:
+            ipaddress.IPv6Address(ip)
+            unique_ipv6.add(ip.lower())
+        except ValueError:
+            continue
+    return unique_ipv4, unique_ipv6
+
+
+def make_page(size_mb, seed=0):
+    """生成类似 wetest.vip / uouin 的 HTML 表格页面: 大量标签、时间、版本号、十六进制串, 夹杂 IP"""
+    rng = random.Random(seed)
+    rows = []
+    size = 0
+    target = int(size_mb * 1048576)
+    while size < target:
+        v4 = f'{rng.choice([104, 162, 172])}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}'
+        v6 = f'2606:4700:{rng.randrange(65536):x}::{rng.randrange(65536):x}'
+        row = (
+            f'<tr class="cf-row data-{rng.randrange(1000)}"><td data-label="线路">电信</td>'
+            f'<td data-label="优选地址">{v4 if rng.random() < 0.7 else v6}</td>'
+            f'<td>{rng.randrange(100)}ms</td><td>{rng.random() * 100:.2f}MB/s</td>'
+            f'<td>2025-11-{rng.randrange(1, 29):02d} 12:{rng.randrange(60):02d}:00</td>'
+            f'<td><span style="color:#{rng.randrange(16**6):06x}">v1.{rng.randrange(20)}.{rng.randrange(20)}</span></td></tr>\n'
+        )
+        rows.append(row)
+        size += len(row)
+    return ''.join(rows)
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='IP 提取基准')
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 4, 16], help='输入大小 (MB)')
+    args = parser.parse_args()
+    print(f'{"大小":>6} {"旧版":>9} {"单遍":>9} {"流式":>9} {"加速":>6}  结果一致')
+    for size_mb in args.sizes:
+        page = make_page(size_mb)
+        (old_v4, old_v6), old_time = timed(legacy_extract, page)
+        (new_v4, new_v6), new_time = timed(extract_ints, page)
+        chunks = [page[i:i + 65536] for i in range(0, len(page), 65536)]
+        (stream_v4, stream_v6), stream_time = timed(extract_stream, chunks)
+        same = (
+            {ipv4_to_str(v) for v in new_v4} == old_v4
+            and {ipv6_to_str(v) for v in new_v6} == {ipaddress.IPv6Address(ip).compressed for ip in old_v6}
+            and (set(stream_v4), set(stream_v6)) == (set(new_v4), set(new_v6))
+        )
+        print(f'{size_mb:>5}M {old_time:>8.3f}s {new_time:>8.3f}s {stream_time:>8.3f}s {old_time / new_time:>5.1f}x  {same}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""基准测试用的本地替身服务: IP 源 (feed) 和地理接口 (ip-api / ipinfo / ipgeolocation)
+
+测速端点见 local_speed_server.py (按目标 IP 限速)。
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# 替身返回的地理信息 (按 IP 哈希固定分配)
+LOCATIONS = [
+    ('US', 'United States', 'San Francisco'),
+    ('US', 'United States', 'Los Angeles'),
+    ('JP', 'Japan', 'Tokyo'),
+    ('SG', 'Singapore', 'Singapore'),
+    ('DE', 'Germany', 'Frankfurt'),
+    ('NL', 'Netherlands', 'Amsterdam'),
+    ('HK', 'Hong Kong', 'Hong Kong'),
+]
+
+
+def location_of(ip):
+    digest = hashlib.md5(ip.encode()).digest()
+    return LOCATIONS[digest[0] % len(LOCATIONS)]
+
+
+class CountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler):
+        super().__init__(address, handler)
+        self.counters = {'requests': 0, 'bytes_sent': 0, 'not_modified': 0, 'rate_limited': 0, 'failed': 0}
+        self.counter_lock = threading.Lock()
+
+    def count(self, key, value=1):
+        with self.counter_lock:
+            self.counters[key] += value
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b'', content_type='text/plain', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count('bytes_sent', len(body))
+
+
+class FeedHandler(_Handler):
+    """GET /feed/<n>.txt, 支持 If-None-Match 返回 304"""
+
+    def do_GET(self):
+        self.server.count('requests')
+        time.sleep(self.server.latency)
+        body = self.server.feeds.get(urlparse(self.path).path)
+        if body is None:
+            self._send(404)
+            return
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.server.count('not_modified')
+            self._send(304, headers={'ETag': etag})
+            return
+        self._send(200, body, headers={'ETag': etag})
+
+
+def make_feeds(total_ips, feed_count=6, seed=0, overlap=0.2, pool=None):
+    """生成 feed_count 个源, 共约 total_ips 个不同地址, 源之间有 overlap 比例的重复; pool 可指定地址列表"""
+    rng = random.Random(seed)
+    prefixes = [104, 162, 172]
+    pool = pool or list({
+        f'{rng.choice(prefixes)}.{rng.randrange(16, 32)}.{rng.randrange(256)}.{rng.randrange(256)}'
+        for _ in range(total_ips)
+    })
+    feeds = {}
+    per_feed = max(1, len(pool) // feed_count)
+    for i in range(feed_count):
+        own = pool[i * per_feed:(i + 1) * per_feed]
+        shared = rng.sample(pool, min(len(pool), int(per_feed * overlap)))
+        lines = [f'{ip}:8443#{location_of(ip)[0]} {rng.random() * 100:.1f}ms' for ip in own + shared]
+        feeds[f'/feed/{i}.txt'] = ('# bench feed\n' + '\n'.join(lines) + '\n').encode()
+    return feeds
+
+
+class GeoHandler(_Handler):
+    """同一端口模拟三家接口, 各自有独立的令牌桶限速 (超出返回 429) 和随机失败率"""
+
+    def _admit(self, provider):
+        self.server.count('requests')
+        time.sleep(self.server.latency)
+        if not self.server.buckets[provider].try_acquire():
+            self.server.count('rate_limited')
+            self._send(429, b'Too Many Requests')
+            return False
+        if self.server.rng.random() < self.server.fail_rate:
+            self.server.count('failed')
+            self._send(503, b'Service Unavailable')
+            return False
+        return True
+
+    def _json(self, data):
+        self._send(200, json.dumps(data).encode(), 'application/json')
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/batch':
+            self._send(404)
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length', '0')))
+        if not self._admit('ip-api'):
+            return
+        result = []
+        for ip in json.loads(body or b'[]'):
+            code, country, city = location_of(ip)
+            result.append({'status': 'success', 'query': ip, 'countryCode': code, 'country': country, 'city': city})
+        self._json(result)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        if parts[:1] == ['json'] and len(parts) == 2:  # ip-api: /json/<ip>
+            if self._admit('ip-api'):
+                code, country, city = location_of(parts[1])
+                self._json({'status': 'success', 'countryCode': code, 'country': country, 'city': city})
+        elif parts == ['ipgeo']:  # ipgeolocation: /ipgeo?ip=
+            if self._admit('ipgeolocation'):
+                code, country, city = location_of(parse_qs(url.query).get('ip', [''])[0])
+                self._json({'country_code': code, 'country_name': country, 'city': city})
+        elif parts[:1] == ['lite'] and len(parts) == 2:  # ipinfo lite: /lite/<ip>
+            if self._admit('ipinfo'):
+                self._json({'country_code': location_of(parts[1])[0]})
+        elif len(parts) == 2 and parts[1] in ('json', 'country'):  # ipinfo: /<ip>/json, /<ip>/country
+            if self._admit('ipinfo'):
+                code, country, city = location_of(parts[0])
+                if parts[1] == 'country':
+                    self._send(200, f'{code}\n'.encode())
+                else:
+                    self._json({'country': code, 'city': city})
+        else:
+            self._send(404)
+
+
+def _serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+def start_feed_server(feeds, latency=0.0, host='127.0.0.1'):
+    """返回 (server, 端口); 源地址为 http://host:端口/feed/<n>.txt"""
+    server = CountingServer((host, 0), FeedHandler)
+    server.feeds = feeds
+    server.latency = latency
+    return _serve(server)
+
+
+def start_geo_server(per_minute=600, fail_rate=0.0, latency=0.0, seed=0, host='127.0.0.1'):
+    """返回 (server, 端口); per_minute 为每家接口每分钟允许的请求数"""
+    from geo_batch import TokenBucket
+    server = CountingServer((host, 0), GeoHandler)
+    server.buckets = {name: TokenBucket(per_minute / 60, per_minute) for name in ('ip-api', 'ipinfo', 'ipgeolocation')}
+    server.fail_rate = fail_rate
+    server.latency = latency
+    server.rng = random.Random(seed)
+    return _serve(server)
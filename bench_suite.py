@@ -0,0 +1,306 @@
+"""离线基准测试: 用本地替身服务跑 autoip6.py 采集和两个测速脚本, 记录耗时/吞吐/流量/峰值内存
+
+用法:
+    python bench_suite.py                               # 默认规模 100 和 1000
+    python bench_suite.py --scales 100 10000 100000 --only collect
+    python bench_suite.py --feed-latency 0.2 --geo-fail-rate 0.1 --env TEST_BUDGET=200
+    python bench_suite.py --only sharded --shards 4         # 4 个进程分片测速后合并
+
+每次运行向 --output (默认 bench_results.jsonl) 追加一行 JSON, 含当前 git 提交, 便于前后对比。
+测速场景的候选地址是 127.x.y.z (Linux 上整个 127.0.0.0/8 都回环到本机), 本地端点按目标 IP 限速。
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench_servers import location_of, make_feeds, start_feed_server, start_geo_server
+from local_speed_server import start_server
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = {
+    'collect': ['autoip6.py'],
+    'speed': ['test_speed.py'],
+    'country': ['国家查询test_speed.py'],
+    'pipeline': ['pipeline.py'],
+    'sharded': ['test_speed.py'],
+}
+
+
+def speed_of(ip):
+    """替身测速端点对每个 IP 的固定带宽 (MB/s), 1~50 之间"""
+    return 1 + hashlib.md5(ip.encode()).digest()[1] % 50
+
+
+def loopback_ips(count, spread=False):
+    """生成 count 个不同的 127.x.y.z 地址 (跳过 127.0.0.0/24 和 .0/.255); spread=True 时每个地址在不同的 /24"""
+    if spread:
+        return [f'127.{1 + i // 254}.{1 + i % 254}.1' for i in range(count)]
+    ips = []
+    value = 256
+    while len(ips) < count:
+        if 0 < value & 255 < 255:
+            ips.append(f'127.{(value >> 16) & 255}.{(value >> 8) & 255}.{value & 255}')
+        value += 1
+    return ips
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_script(args, workdir, env, timeout, log_path):
+    """运行子进程, 返回 (退出码, 墙钟秒, 峰值 RSS KB); 超时则杀掉, 退出码为 None"""
+    with open(log_path, 'a', encoding='utf-8') as log:
+        started = time.monotonic()
+        command = [sys.executable] + [os.path.join(REPO, arg) for arg in args]
+        proc = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        timer = threading.Timer(timeout, proc.kill)
+        timer.start()
+        try:
+            _, status, usage = os.wait4(proc.pid, 0)  # 用 wait4 拿到子进程的 ru_maxrss
+        finally:
+            timer.cancel()
+        wall_time = time.monotonic() - started
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    code = None if proc.returncode == -9 else proc.returncode
+    return code, wall_time, usage.ru_maxrss
+
+
+def run_parallel(args, workdir, envs, timeout, log_path):
+    """同时运行多个子进程 (每个 env 一个), 返回 (退出码列表, 墙钟秒, 最大峰值 RSS KB)"""
+    with open(log_path, 'a', encoding='utf-8') as log:
+        started = time.monotonic()
+        command = [sys.executable] + [os.path.join(REPO, arg) for arg in args]
+        procs = [subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT) for env in envs]
+        timer = threading.Timer(timeout, lambda: [proc.kill() for proc in procs])
+        timer.start()
+        codes, peak = [], 0
+        try:
+            for proc in procs:
+                _, status, usage = os.wait4(proc.pid, 0)
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                codes.append(None if proc.returncode == -9 else proc.returncode)
+                peak = max(peak, usage.ru_maxrss)
+        finally:
+            timer.cancel()
+        wall_time = time.monotonic() - started
+    return codes, wall_time, peak
+
+
+def count_lines(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'r', encoding='utf-8') as f:
+        return sum(1 for line in f if line.strip())
+
+
+def base_env(args, geo_port):
+    geo = f'http://127.0.0.1:{geo_port}'
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': REPO + os.pathsep + env.get('PYTHONPATH', ''),
+        'PYTHONUNBUFFERED': '1',
+        'IP_API_URL': geo,
+        'IPINFO_API_URL': geo,
+        'IPINFO_URL': geo,
+        'IPGEO_URL': geo,
+        'IP_API_BATCH_PER_MINUTE': str(args.geo_rate),
+        'IPINFO_RATE': str(args.geo_rate / 60),
+        'IP_API_PER_MINUTE': str(args.geo_rate),
+        'IPINFO_PER_MINUTE': str(args.geo_rate),
+        'IPGEO_PER_MINUTE': str(args.geo_rate),
+    })
+    for item in args.env:
+        key, _, value = item.partition('=')
+        env[key] = value
+    return env
+
+
+def bench_collect(scale, args, workdir, geo):
+    """冷启动采集一次, 再带缓存 (ETag/地理缓存) 采集一次"""
+    feed_server, feed_port = start_feed_server(make_feeds(scale, seed=args.seed), latency=args.feed_latency)
+    env = base_env(args, geo.server_address[1])
+    env['AUTOIP6_URLS'] = ' '.join(f'http://127.0.0.1:{feed_port}{path}' for path in sorted(feed_server.feeds))
+    records = []
+    try:
+        for phase in ('cold', 'warm'):
+            feed_before = dict(feed_server.counters)
+            geo_before = dict(geo.counters)
+            code, wall_time, rss = run_script(SCENARIOS['collect'], workdir, env, args.timeout,
+                                              os.path.join(workdir, 'bench.log'))
+            records.append({
+                'scenario': f'collect-{phase}',
+                'exit_code': code,
+                'wall_time': wall_time,
+                'peak_rss_kb': rss,
+                'output_ips': count_lines(os.path.join(workdir, 'ip.txt')),
+                'feed_requests': feed_server.counters['requests'] - feed_before['requests'],
+                'feed_not_modified': feed_server.counters['not_modified'] - feed_before['not_modified'],
+                'feed_bytes': feed_server.counters['bytes_sent'] - feed_before['bytes_sent'],
+                **_geo_delta(geo, geo_before),
+            })
+    finally:
+        feed_server.shutdown()
+    return records
+
+
+def bench_speed(scenario, scale, args, workdir, geo, speed_port, speed_server):
+    with open(os.path.join(workdir, 'ip.txt'), 'w', encoding='utf-8') as f:
+        for ip in loopback_ips(scale):
+            f.write(f'{ip}:{speed_port}#{location_of(ip)[0]}\n')
+    env = base_env(args, geo.server_address[1])
+    geo_before = dict(geo.counters)
+    speed_before = dict(speed_server.counters)
+    code, wall_time, rss = run_script(SCENARIOS[scenario], workdir, env, args.timeout,
+                                      os.path.join(workdir, 'bench.log'))
+    return [{
+        'scenario': scenario,
+        'exit_code': code,
+        'wall_time': wall_time,
+        'peak_rss_kb': rss,
+        'output_ips': count_lines(os.path.join(workdir, 'speed_ip.txt')),
+        'speed_bytes': speed_server.counters['bytes_sent'] - speed_before['bytes_sent'],
+        'upload_bytes': speed_server.counters['bytes_received'] - speed_before['bytes_received'],
+        **_geo_delta(geo, geo_before),
+    }]
+
+
+def bench_sharded(scale, args, workdir, geo, speed_port, speed_server):
+    """--shards 个进程各测一片 (SHARD=i/N), 全部结束后用 shard.py merge 合并"""
+    with open(os.path.join(workdir, 'ip.txt'), 'w', encoding='utf-8') as f:
+        for ip in loopback_ips(scale, spread=True):  # 按子网分片, 地址要分布在多个 /24
+            f.write(f'{ip}:{speed_port}#{location_of(ip)[0]}\n')
+    env = base_env(args, geo.server_address[1])
+    envs = [dict(env, SHARD=f'{i}/{args.shards}') for i in range(args.shards)]
+    geo_before = dict(geo.counters)
+    speed_before = dict(speed_server.counters)
+    log_path = os.path.join(workdir, 'bench.log')
+    codes, wall_time, rss = run_parallel(SCENARIOS['sharded'], workdir, envs, args.timeout, log_path)
+    merge_started = time.monotonic()
+    with open(log_path, 'a', encoding='utf-8') as log:
+        merged = subprocess.run([sys.executable, os.path.join(REPO, 'shard.py'), 'merge']
+                                + sorted(glob.glob(os.path.join(workdir, 'speed_part_*.jsonl'))),
+                                cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    wall_time += time.monotonic() - merge_started
+    failed = [code for code in codes + [merged.returncode] if code != 0]
+    return [{
+        'scenario': f'sharded-{args.shards}',
+        'exit_code': failed[0] if failed else 0,
+        'wall_time': wall_time,
+        'peak_rss_kb': rss,
+        'output_ips': count_lines(os.path.join(workdir, 'speed_ip.txt')),
+        'speed_bytes': speed_server.counters['bytes_sent'] - speed_before['bytes_sent'],
+        'upload_bytes': speed_server.counters['bytes_received'] - speed_before['bytes_received'],
+        **_geo_delta(geo, geo_before),
+    }]
+
+
+def bench_pipeline(scale, args, workdir, geo, speed_port, speed_server):
+    """源里放 127.x.y.z 地址, 采集到的 IP 直接在本地端点上测速"""
+    feed_server, feed_port = start_feed_server(make_feeds(scale, seed=args.seed, pool=loopback_ips(scale)),
+                                               latency=args.feed_latency)
+    env = base_env(args, geo.server_address[1])
+    env['AUTOIP6_URLS'] = ' '.join(f'http://127.0.0.1:{feed_port}{path}' for path in sorted(feed_server.feeds))
+    env['PIPELINE_PORT'] = str(speed_port)
+    geo_before = dict(geo.counters)
+    speed_before = dict(speed_server.counters)
+    try:
+        code, wall_time, rss = run_script(SCENARIOS['pipeline'], workdir, env, args.timeout,
+                                          os.path.join(workdir, 'bench.log'))
+    finally:
+        feed_server.shutdown()
+    return [{
+        'scenario': 'pipeline',
+        'exit_code': code,
+        'wall_time': wall_time,
+        'peak_rss_kb': rss,
+        'output_ips': count_lines(os.path.join(workdir, 'speed_ip.txt')),
+        'feed_bytes': feed_server.counters['bytes_sent'],
+        'speed_bytes': speed_server.counters['bytes_sent'] - speed_before['bytes_sent'],
+        'upload_bytes': speed_server.counters['bytes_received'] - speed_before['bytes_received'],
+        **_geo_delta(geo, geo_before),
+    }]
+
+
+def _geo_delta(geo, before):
+    return {
+        'geo_requests': geo.counters['requests'] - before['requests'],
+        'geo_rate_limited': geo.counters['rate_limited'] - before['rate_limited'],
+        'geo_failed': geo.counters['failed'] - before['failed'],
+    }
+
+
+def print_table(records):
+    print(f"\n{'场景':<14}{'规模':>8}{'退出码':>8}{'耗时s':>9}{'IP/s':>10}{'流量MB':>9}{'峰值内存MB':>12}{'地理请求':>9}{'输出':>7}")
+    for r in records:
+        size = (r.get('feed_bytes', 0) + r.get('speed_bytes', 0) + r.get('upload_bytes', 0)) / 1048576
+        print(f"{r['scenario']:<14}{r['scale']:>8}{str(r['exit_code']):>8}{r['wall_time']:>9.1f}"
+              f"{r['throughput']:>10.0f}{size:>9.1f}{r['peak_rss_kb'] / 1024:>12.1f}"
+              f"{r['geo_requests']:>9}{r['output_ips']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线基准测试')
+    parser.add_argument('--scales', type=int, nargs='+', default=[100, 1000], help='候选 IP 数量')
+    parser.add_argument('--only', nargs='+', choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument('--feed-latency', type=float, default=0.05, help='源服务每个请求的延迟秒数')
+    parser.add_argument('--geo-latency', type=float, default=0.02, help='地理接口每个请求的延迟秒数')
+    parser.add_argument('--geo-rate', type=float, default=600, help='每家地理接口每分钟允许的请求数')
+    parser.add_argument('--geo-fail-rate', type=float, default=0.0, help='地理接口随机返回 503 的比例')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='传给被测脚本的环境变量')
+    parser.add_argument('--timeout', type=float, default=1800, help='单次运行超时秒数')
+    parser.add_argument('--shards', type=int, default=3, help='sharded 场景的进程数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.jsonl')
+    parser.add_argument('--keep', action='store_true', help='保留临时工作目录 (含被测脚本日志)')
+    args = parser.parse_args()
+
+    geo, _ = start_geo_server(args.geo_rate, args.geo_fail_rate, args.geo_latency, args.seed)
+    speed_server = speed_port = None
+    if {'speed', 'country', 'pipeline', 'sharded'} & set(args.only):
+        speed_server, speed_port = start_server(host='0.0.0.0', rate_for=speed_of)
+    common = {'revision': git_revision(), 'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': sys.version.split()[0], 'params': {k: v for k, v in vars(args).items() if k not in ('output', 'keep')}}
+    records = []
+    try:
+        for scale in args.scales:
+            for scenario in args.only:
+                workdir = tempfile.mkdtemp(prefix=f'bench-{scenario}-{scale}-')
+                print(f'运行 {scenario} (规模 {scale}), 工作目录 {workdir}')
+                if scenario == 'collect':
+                    new = bench_collect(scale, args, workdir, geo)
+                elif scenario == 'sharded':
+                    new = bench_sharded(scale, args, workdir, geo, speed_port, speed_server)
+                elif scenario == 'pipeline':
+                    new = bench_pipeline(scale, args, workdir, geo, speed_port, speed_server)
+                else:
+                    new = bench_speed(scenario, scale, args, workdir, geo, speed_port, speed_server)
+                for record in new:
+                    record.update(common, scale=scale, throughput=scale / max(record['wall_time'], 1e-9))
+                    with open(args.output, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                records.extend(new)
+                if not args.keep:
+                    shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        geo.shutdown()
+        if speed_server is not None:
+            speed_server.shutdown()
+    print_table(records)
+    print(f'\n结果已追加到 {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""动态站点 (需要 JS 渲染) 的无头浏览器: 每次运行只启动一个 Chrome, 各动态源在标签页中同时加载,
+页面里出现足够多的 IP 且不再增加时就读取, 不再每个源固定等 10 秒
+
+    DYNAMIC_MIN_IPS=20 DYNAMIC_TIMEOUT=15 python autoip6.py
+    python checks.py browser             # 用模拟浏览器自测就绪判断 (不需要 Chrome/selenium)
+
+页面加载策略为 none: driver.get() 发起导航后立即返回, 由轮询判断页面是否就绪。
+selenium 只在真正有动态源时才导入 (静态源采集不依赖浏览器)。
+"""
+import os
+import time
+
+from ip_extract import extract_stream
+from run_trace import tracer
+
+BROWSER_TABS = int(os.environ.get('BROWSER_TABS', '4'))  # 同时加载的标签页数
+DYNAMIC_MIN_IPS = int(os.environ.get('DYNAMIC_MIN_IPS', '5'))  # 就绪条件: 页面中至少有这么多个不同的 IP
+DYNAMIC_TIMEOUT = float(os.environ.get('DYNAMIC_TIMEOUT', '15'))  # 单个页面最多等这么久, 到时读取已有内容
+POLL_INTERVAL = 0.25
+
+
+def count_ips(html):
+    ipv4_ints, ipv6_ints = extract_stream([html])
+    return len(set(ipv4_ints)) + len(set(ipv6_ints))
+
+
+def chrome_options():
+    from selenium.webdriver.chrome.options import Options
+    options = Options()
+    options.add_argument('--headless=new')  # 无头模式, 适合Actions
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--blink-settings=imagesEnabled=false')  # 只要文本, 不下载图片
+    options.page_load_strategy = 'none'
+    return options
+
+
+def start_chrome():
+    """优先用 Selenium 自带的驱动管理 (或 PATH 中的 chromedriver), 不行再用 webdriver-manager 下载"""
+    from selenium import webdriver
+    try:
+        return webdriver.Chrome(options=chrome_options())
+    except Exception as e:
+        print(f'Chrome 启动失败 ({e}), 改用 webdriver-manager 下载驱动')
+    from selenium.webdriver.chrome.service import Service
+    from webdriver_manager.chrome import ChromeDriverManager
+    return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options())
+
+
+class BrowserPool:
+    """一个 Chrome 实例 + 最多 tabs 个同时加载的标签页; 用 with 语句保证退出时关闭浏览器
+
+    第一个窗口一直保留为空白页 (最后一个窗口关闭时浏览器会退出), 每个源在新标签页中打开, 读完即关。
+    """
+
+    def __init__(self, tabs=BROWSER_TABS, min_ips=DYNAMIC_MIN_IPS, timeout=DYNAMIC_TIMEOUT, start=start_chrome):
+        self.tabs = max(1, tabs)
+        self.min_ips = min_ips
+        self.timeout = timeout
+        self.start = start
+        self.driver = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+
+    def _ensure_started(self):
+        if self.driver is None:
+            with tracer.span('dynamic.browser_start'):
+                self.driver = self.start()
+            self.home = self.driver.current_window_handle
+
+    def _open(self, url):
+        """在新标签页中发起导航, 返回标签页句柄"""
+        self.driver.switch_to.new_window('tab')
+        handle = self.driver.current_window_handle
+        try:
+            self.driver.get(url)  # 加载策略为 none, 立即返回
+        except Exception:
+            self._close(handle)
+            raise
+        return handle
+
+    def _close(self, handle):
+        self.driver.switch_to.window(handle)
+        self.driver.close()
+        self.driver.switch_to.window(self.home)
+
+    def fetch_all(self, urls):
+        """并发加载 urls, 返回 {url: 页面HTML}; 打开失败的 url 不在结果中
+
+        就绪条件: 不同 IP 数 >= min_ips 且与上一次轮询相同 (列表已渲染完); 超过 timeout 时按已有内容返回。
+        """
+        if not urls:
+            return {}
+        self._ensure_started()
+        pending = list(urls)
+        active = {}  # 句柄 -> {'url', 'started', 'count'}
+        pages = {}
+        while pending or active:
+            while pending and len(active) < self.tabs:
+                url = pending.pop(0)
+                try:
+                    handle = self._open(url)
+                except Exception as e:  # 捕获Selenium错误
+                    print(f'Failed to open {url}: {e}')
+                    tracer.count('dynamic.error')
+                    continue
+                active[handle] = {'url': url, 'started': time.monotonic(), 'count': -1}
+            time.sleep(POLL_INTERVAL)
+            for handle, page in list(active.items()):
+                elapsed = time.monotonic() - page['started']
+                try:
+                    self.driver.switch_to.window(handle)
+                    html = self.driver.page_source
+                except Exception as e:
+                    print(f"Failed to read {page['url']}: {e}")
+                    tracer.count('dynamic.error')
+                    del active[handle]
+                    self._close(handle)
+                    continue
+                count = count_ips(html)
+                ready = count >= self.min_ips and count == page['count']
+                if not ready and elapsed < self.timeout:
+                    page['count'] = count
+                    continue
+                if not ready:
+                    tracer.count('dynamic.timeout')
+                tracer.record('dynamic.wait', elapsed, url=page['url'], ips=count, ready=ready)
+                print(f"{page['url']} {'ready' if ready else 'timed out'} after {elapsed:.1f}s with {count} IPs")
+                pages[page['url']] = html
+                del active[handle]
+                self._close(handle)
+        return pages
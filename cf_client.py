@@ -0,0 +1,164 @@
+import http.client
+import socket
+import ssl
+import threading
+import time
+from collections import OrderedDict
+
+from run_trace import tracer
+
+HOST = 'speed.cloudflare.com'
+CONNECT_TIMEOUT = 10
+READ_SIZE = 65536
+USER_AGENT = 'Mozilla/5.0'
+
+# 与 curl --insecure 一致: 不校验证书 (IP 是我们自己指定的)
+tls_context = ssl.create_default_context()
+tls_context.check_hostname = False
+tls_context.verify_mode = ssl.CERT_NONE
+
+
+class PinnedConnection(http.client.HTTPSConnection):
+    """连到指定 IP, SNI/Host 仍是 host (等同 curl --resolve), 并记录连接/握手耗时"""
+
+    def __init__(self, ip, port=443, host=HOST, timeout=CONNECT_TIMEOUT):
+        super().__init__(host, port, timeout=timeout, context=tls_context)
+        self.ip = ip
+        self.timings = {'dns': 0.0, 'connect': 0.0, 'tls': 0.0}  # 不解析域名, dns 恒为 0
+
+    def connect(self):
+        started = time.monotonic()
+        sock = socket.create_connection((self.ip, self.port), self.timeout)
+        connected = time.monotonic()
+        try:
+            self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+        except BaseException:
+            sock.close()
+            raise
+        self.timings['connect'] = connected - started
+        self.timings['tls'] = time.monotonic() - connected
+
+
+class PinnedResponse:
+    """一次请求的响应; 读完后 close() 会把连接放回池中复用, 没读完则直接断开"""
+
+    def __init__(self, client, key, conn, response, timings):
+        self.client = client
+        self.key = key
+        self.conn = conn
+        self.response = response
+        self.status = response.status
+        self.headers = response.headers
+        self.timings = timings
+
+    def iter_chunks(self, size=READ_SIZE):
+        """逐块产出 bytes; 读完时记录 transfer 耗时"""
+        started = time.monotonic()
+        while True:
+            data = self.response.read1(size)
+            if not data:
+                break
+            yield data
+        self.timings['transfer'] = time.monotonic() - started
+
+    def read(self):
+        return b''.join(self.iter_chunks())
+
+    def close(self):
+        if self.conn is None:
+            return
+        # 读完正文 (length 归零) 且服务端允许 keep-alive 时才能复用
+        finished = self.response.isclosed() or self.response.length == 0
+        self.response.close()
+        if finished and not self.response.will_close:
+            self.client.release(self.key, self.conn)
+        else:
+            self.conn.close()
+        self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PinnedClient:
+    """按 (ip, port) 复用 keep-alive 连接的 HTTPS 客户端, 线程安全
+
+    空闲连接最多保留 max_idle_keys 个 (ip, port) (最近使用的优先), 每个最多 max_idle_per_key 个;
+    一个 IP 测完后很快被挤出, 几百个 IP 的运行也不会一直占着几百个 TLS 连接。
+    """
+
+    def __init__(self, host=HOST, timeout=CONNECT_TIMEOUT, max_idle_per_key=2, max_idle_keys=16):
+        self.host = host
+        self.timeout = timeout
+        self.max_idle_per_key = max_idle_per_key
+        self.max_idle_keys = max_idle_keys
+        self.idle = OrderedDict()  # (ip, port) -> [空闲连接], 按最近放回的顺序
+        self.lock = threading.Lock()
+
+    def _acquire(self, key):
+        with self.lock:
+            conns = self.idle.get(key)
+            if conns:
+                conn = conns.pop()
+                if not conns:
+                    del self.idle[key]
+                return conn, True
+        return PinnedConnection(key[0], key[1], self.host, self.timeout), False
+
+    def release(self, key, conn):
+        evicted = []
+        with self.lock:
+            conns = self.idle.setdefault(key, [])
+            self.idle.move_to_end(key)
+            if len(conns) < self.max_idle_per_key:
+                conns.append(conn)
+            else:
+                evicted.append(conn)
+            while len(self.idle) > self.max_idle_keys:
+                evicted.extend(self.idle.popitem(last=False)[1])
+        for old in evicted:
+            old.close()
+
+    def request(self, ip, port, path, method='GET', body=None, headers=None):
+        """发请求并返回 PinnedResponse; timings 含 dns/connect/tls/ttfb (复用连接时 connect/tls 为 0)"""
+        key = (ip, int(port))
+        conn, reused = self._acquire(key)
+        all_headers = {'User-Agent': USER_AGENT}
+        all_headers.update(headers or {})
+        for attempt in range(2):
+            try:
+                if not reused:
+                    conn.connect()
+                timings = {'dns': 0.0, 'connect': 0.0, 'tls': 0.0, 'reused': reused}
+                if not reused:
+                    timings['connect'] = conn.timings['connect']
+                    timings['tls'] = conn.timings['tls']
+                sent = time.monotonic()
+                conn.request(method, path, body=body, headers=all_headers)
+                response = conn.getresponse()
+                timings['ttfb'] = time.monotonic() - sent
+                return PinnedResponse(self, key, conn, response, timings)
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if not reused or attempt:
+                    raise
+                # 空闲连接已被服务端关掉, 换新连接重试一次
+                tracer.count('client.stale_retry')
+                conn, reused = PinnedConnection(ip, key[1], self.host, self.timeout), False
+            except BaseException:
+                conn.close()
+                raise
+
+    def close(self):
+        with self.lock:
+            conns = [conn for conns in self.idle.values() for conn in conns]
+            self.idle.clear()
+        for conn in conns:
+            conn.close()
+
+
+# 测速脚本共用的客户端
+default_client = PinnedClient()
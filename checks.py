@@ -0,0 +1,114 @@
+"""离线自测 (不需要网络、Chrome 或 selenium), 任何一项不通过时退出码为 1
+
+    python checks.py                 # 全部
+    python checks.py score browser   # 只测指定的几项
+"""
+import argparse
+import sys
+import time
+
+from browser_pool import BrowserPool, count_ips
+from result_store import WEIGHTS, composite_score, parse_weights, speed_floor
+
+
+def check_score():
+    """speed_floor 与 composite_score 一致: 带宽恰好等于门槛、其余各项满分时, 综合评分等于门槛"""
+    perfect = {'loss': 0.0, 'latency': 0.0, 'jitter': 0.0}
+    ok = True
+    for weights in (WEIGHTS, parse_weights('speed=1'), parse_weights('speed=0.5,latency=0.5'), parse_weights('upload=1,speed=1')):
+        for upload in (False, True):
+            for metric in ('speed', 'upload') if upload else ('speed',):
+                for cutoff in (30, 50, 70, 80, 95):
+                    floor = speed_floor(cutoff, metric, weights, upload)
+                    if not 0 < floor < float('inf'):
+                        continue  # 门槛为 0 (其余满分即可进入) 或无穷大 (怎样都进不了), 没有可比的点
+                    row = dict(perfect, score=1e12, upload=1e12 if upload else None)
+                    row['score' if metric == 'speed' else 'upload'] = floor
+                    score = composite_score(row, weights)
+                    if abs(score - cutoff) > 1e-6:
+                        ok = False
+                        print(f"失败: {weights} upload={upload} {metric} 门槛 {cutoff}: 带宽 {floor:.2f}MB/s 时评分 {score:.2f}")
+    print(f"{'通过' if ok else '失败'}: speed_floor 与 composite_score 一致")
+    return ok
+
+
+class _FakeSwitch:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def new_window(self, kind):
+        self.driver.opened += 1
+        handle = f'tab{self.driver.opened}'
+        self.driver.windows[handle] = None
+        self.driver.current_window_handle = handle
+
+    def window(self, handle):
+        self.driver.current_window_handle = handle
+
+
+class _FakeDriver:
+    """模拟 WebDriver: 页面加载后每 0.3s 渲染出 3 个 IP, 最多 12 个; URL 含 slow 的只渲染 1 个, 含 broken 的打不开"""
+
+    def __init__(self):
+        self.opened = 0
+        self.windows = {'home': None}  # 句柄 -> (url, 开始时间)
+        self.current_window_handle = 'home'
+        self.switch_to = _FakeSwitch(self)
+        self.quit_called = False
+
+    def get(self, url):
+        if 'broken' in url:
+            raise RuntimeError('net::ERR_NAME_NOT_RESOLVED')
+        self.windows[self.current_window_handle] = (url, time.monotonic())
+
+    @property
+    def page_source(self):
+        url, started = self.windows[self.current_window_handle]
+        count = 1 if 'slow' in url else min(12, int((time.monotonic() - started) / 0.3) * 3)
+        return '<html>' + ' '.join(f'104.16.0.{i}' for i in range(count)) + ' ' * 100 + '</html>'
+
+    def close(self):
+        del self.windows[self.current_window_handle]
+
+    def quit(self):
+        self.quit_called = True
+
+
+def check_browser():
+    """browser_pool 的就绪判断 (用模拟浏览器): 数量达标且稳定才读、超时兜底、打不开的跳过、标签页全部关闭; 不通过时返回 False"""
+    driver = _FakeDriver()
+    urls = ['https://fast-1', 'https://broken', 'https://slow', 'https://fast-2']
+    started = time.monotonic()
+    with BrowserPool(tabs=2, min_ips=5, timeout=2, start=lambda: driver) as pool:
+        pages = pool.fetch_all(urls)
+    elapsed = time.monotonic() - started
+    checks = [
+        ('打不开的页面不在结果中', sorted(pages) == ['https://fast-1', 'https://fast-2', 'https://slow']),
+        ('就绪页面等到 IP 数稳定 (12 个) 才读取', all(count_ips(pages[url]) == 12 for url in ('https://fast-1', 'https://fast-2'))),
+        ('IP 不够的页面到超时按已有内容返回', count_ips(pages['https://slow']) == 1),
+        ('总耗时受超时上限约束', elapsed < 2 * 2 + 1),
+        ('标签页全部关闭, 只剩首页', list(driver.windows) == ['home']),
+        ('退出时关闭浏览器', driver.quit_called),
+    ]
+    for name, ok in checks:
+        print(f"{'通过' if ok else '失败'}: {name}")
+    print(f'总耗时 {elapsed:.1f}s')
+    return all(ok for _, ok in checks)
+
+
+CHECKS = {'score': check_score, 'browser': check_browser}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线自测')
+    parser.add_argument('names', nargs='*', help=f"要运行的自测 ({', '.join(CHECKS)}), 不写为全部")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in CHECKS]
+    if unknown:
+        parser.error(f"未知的自测: {', '.join(unknown)}")
+    results = [CHECKS[name]() for name in args.names or CHECKS]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
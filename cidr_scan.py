@@ -0,0 +1,181 @@
+"""把 busi.txt 中的 Cloudflare 网段展开成候选地址, 用异步 TCP 连接高速探测
+
+用法:
+    python cidr_scan.py                                  # busi.txt 每个 /16 的每个 /24 (IPv6 每个 /48) 取 2 个地址
+    python cidr_scan.py --sample 0 --concurrency 2000    # 全量扫描
+    python cidr_scan.py --prefix 20 --rate 5000 --budget 200000 --top 300
+    python test_speed.py ip.txt scan_ip.txt              # 可达地址直接进入测速
+"""
+import argparse
+import asyncio
+import heapq
+import ipaddress
+import random
+import time
+
+from ipset import IPSet
+
+
+# 抽样时同一块内的地址表现接近: IPv4 按 /24, IPv6 按 /48 (与 subnet_sampler 的子网划分一致)
+SAMPLE_PREFIX = {4: 24, 6: 48}
+
+
+def load_ranges(path, default_prefix, default_prefix_v6=48):
+    """每行一个网段; 只写了网络地址(如 104.16.0.0 或 [2606:4700::0])的按 default_prefix / default_prefix_v6 处理
+
+    无法解析的行打印后跳过, 不影响其他网段的扫描。
+    """
+    networks = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            address, _, prefix = line.partition('/')
+            address = address.strip('[]')
+            if not prefix:
+                prefix = default_prefix_v6 if ':' in address else default_prefix
+            try:
+                networks.append(ipaddress.ip_network(f'{address}/{prefix}', strict=False))
+            except ValueError as e:
+                print(f'{path} 第 {number} 行无法解析, 跳过: {e}')
+    return networks
+
+
+def iter_candidates(networks, sample, seed=0):
+    """逐个产出候选地址 (生成器, 内存占用与网段大小无关)
+
+    sample > 0 时每个抽样块 (IPv4 /24, IPv6 /48) 只取 sample 个地址 (同一块的 Cloudflare IP 表现接近); 0 表示全部。
+    """
+    rng = random.Random(seed)
+    for network in networks:
+        address = type(network.network_address)  # IPv4Address / IPv6Address
+        first = int(network.network_address)
+        if network.num_addresses <= 256 or sample <= 0:  # IPv6 全量扫描请配合 --budget
+            for value in range(first, first + network.num_addresses):
+                yield address(value)
+            continue
+        block_size = min(1 << (network.max_prefixlen - SAMPLE_PREFIX[network.version]), network.num_addresses)
+        for base in range(first, first + network.num_addresses, block_size):
+            for offset in _sample_offsets(rng, block_size, sample):
+                yield address(base + offset)
+
+
+def _sample_offsets(rng, block_size, count):
+    """块内不重复的随机偏移, 跳过第一个和最后一个地址 (IPv4 的 .0 / .255)"""
+    count = min(count, block_size - 2)
+    if block_size <= 1 << 16:
+        return rng.sample(range(1, block_size - 1), count)
+    offsets = set()  # IPv6 块太大, range 无法求长度, 逐个抽取
+    while len(offsets) < count:
+        offsets.add(rng.randrange(1, block_size - 1))
+    return sorted(offsets)
+
+
+class AsyncRateLimiter:
+    """异步令牌桶: 限制每秒发起的连接数"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def probe(ip, port, timeout):
+    """返回 TCP 连接毫秒数, 不通返回 None"""
+    started = time.monotonic()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(str(ip), port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    elapsed = (time.monotonic() - started) * 1000
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return elapsed
+
+
+async def scan(candidates, port=443, concurrency=1000, rate=2000, timeout=1.0, budget=0, top=0):
+    """固定数量的 worker 从同一个生成器取地址 (不为每个地址建任务)
+
+    top > 0 时只在堆里保留连接最快的 top 个, 内存有上限。返回按延迟升序的 [(ip, 连接毫秒)]
+    """
+    limiter = AsyncRateLimiter(rate) if rate > 0 else None
+    reachable = []  # top > 0 时是以 -延迟 为键的堆
+    stats = {'probed': 0, 'reachable': 0}
+    source = iter(candidates)
+
+    async def worker():
+        while budget <= 0 or stats['probed'] < budget:
+            try:
+                ip = next(source)
+            except StopIteration:
+                return
+            stats['probed'] += 1
+            if limiter is not None:
+                await limiter.acquire()
+            elapsed = await probe(ip, port, timeout)
+            if elapsed is None:
+                continue
+            stats['reachable'] += 1
+            if top <= 0:
+                reachable.append((-elapsed, str(ip)))
+            elif len(reachable) < top:
+                heapq.heappush(reachable, (-elapsed, str(ip)))
+            elif -elapsed > reachable[0][0]:
+                heapq.heapreplace(reachable, (-elapsed, str(ip)))
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.monotonic() - started
+    print(f'扫描 {stats["probed"]} 个地址, {stats["reachable"]} 个可达, 耗时 {seconds:.1f}s ({stats["probed"] / max(seconds, 1e-9):.0f} 个/秒)')
+    return [(ip, -neg_elapsed) for neg_elapsed, ip in sorted(reachable, reverse=True)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cloudflare 网段扫描')
+    parser.add_argument('--ranges', default='busi.txt', help='网段文件')
+    parser.add_argument('--prefix', type=int, default=16, help='只写网络地址的 IPv4 行按此前缀长度展开')
+    parser.add_argument('--prefix6', type=int, default=48, help='只写网络地址的 IPv6 行按此前缀长度展开')
+    parser.add_argument('--sample', type=int, default=2, help='每个 /24 抽取的地址数, 0 为全部')
+    parser.add_argument('--port', type=int, default=443)
+    parser.add_argument('--concurrency', type=int, default=1000, help='同时进行的连接数')
+    parser.add_argument('--rate', type=int, default=2000, help='每秒最多发起的连接数, 0 为不限')
+    parser.add_argument('--timeout', type=float, default=1.0)
+    parser.add_argument('--budget', type=int, default=0, help='最多探测的地址数, 0 为不限')
+    parser.add_argument('--top', type=int, default=200, help='按连接延迟保留的地址数, 0 为全部')
+    parser.add_argument('--output', default='scan_ip.txt')
+    args = parser.parse_args()
+
+    networks = load_ranges(args.ranges, args.prefix, args.prefix6)
+    print(f'读取到 {len(networks)} 个网段: {", ".join(str(n) for n in networks)}')
+    kept = asyncio.run(scan(iter_candidates(networks, args.sample), args.port, args.concurrency,
+                            args.rate, args.timeout, args.budget, args.top))
+    # 按数值顺序写出, 格式与 ip.txt 相同, 可直接交给测速脚本
+    ipset = IPSet()
+    ipset.add_v4(ip for ip, _ in kept if ':' not in ip)
+    ipset.add_v6(ip for ip, _ in kept if ':' in ip)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for ip in ipset.ipv4_strings():
+            f.write(f'{ip}:{args.port}#CF\n')
+        for ip in ipset.ipv6_strings():
+            f.write(f'[{ip}]:{args.port}#CF-IPV6\n')
+    print(f'保留连接最快的 {len(kept)} 个写入 {args.output}')
+
+
+if __name__ == '__main__':
+    main()
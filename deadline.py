@@ -0,0 +1,113 @@
+"""测速时间预算: 按期望价值排序候选, 剩余时间不够再测一个 IP 时不再开始新的测速, 过程中定期原子写出排名
+
+定时任务每小时一次, 候选变多或网络变慢时也要在下一次开始前发布结果:
+    TIME_BUDGET=2400 python test_speed.py     # 40 分钟内结束 (0 或不设为不限时)
+"""
+import os
+import threading
+import time
+
+from result_store import composite_score
+
+TIME_BUDGET = float(os.environ.get('TIME_BUDGET', '0'))
+WRITE_RESERVE = 15  # 留给最后写文件/收尾的秒数
+DURATION_MARGIN = 1.5  # 估计单个测速耗时的放大系数 (耗时有波动, 宁可少测一个也不超时)
+INITIAL_ESTIMATE = 20  # 还没有完成的测速时, 假设一个测速要这么多秒
+DURATION_ALPHA = 0.2  # 测速耗时 EWMA 系数
+CHECKPOINT_EVERY = 10  # 每得到这么多个结果写一次排名
+CHECKPOINT_SECONDS = 60  # 或距上次写出超过这么多秒
+
+
+class Deadline:
+    """墙钟截止时间 + 单个测速耗时估计, 线程安全; seconds <= 0 表示不限时"""
+
+    def __init__(self, seconds=TIME_BUDGET, reserve=WRITE_RESERVE):
+        self.ends = time.monotonic() + seconds if seconds > 0 else None
+        self.reserve = reserve
+        self.estimate = None  # 单个测速耗时的 EWMA 秒数
+        self.stopped = False  # 已因时间不够拒绝过开始新的测速
+        self.lock = threading.Lock()
+
+    def remaining(self):
+        return float('inf') if self.ends is None else self.ends - time.monotonic()
+
+    def observe(self, seconds):
+        with self.lock:
+            self.estimate = seconds if self.estimate is None else (1 - DURATION_ALPHA) * self.estimate + DURATION_ALPHA * seconds
+
+    def can_start(self):
+        """剩余时间 (扣除收尾预留) 还够完成一个测速时返回 True; 首次不够时打印提示"""
+        if self.ends is None:
+            return True
+        with self.lock:
+            needed = (self.estimate if self.estimate is not None else INITIAL_ESTIMATE) * DURATION_MARGIN
+            if self.remaining() - self.reserve >= needed:
+                return True
+            if not self.stopped:
+                self.stopped = True
+                print(f"时间预算将尽 (剩余 {self.remaining():.0f}s, 单个测速约 {needed:.0f}s), 不再开始新的测速")
+            return False
+
+
+def previous_placements(paths):
+    """上次发布的排名: {(ip, port): 名次}, 名次从 0 开始; 文件不存在时为空"""
+    placements = {}
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                address, _, rest = line.strip().partition('#')
+                ip, _, port = address.rpartition(':')
+                if rest and port.isdigit():
+                    placements.setdefault((ip.strip('[]'), int(port)), len(placements))
+    return placements
+
+
+def prioritize(candidates, store, placements):
+    """按期望价值排序: 上次发布过的按原名次排最前, 其余按历史综合评分 (没有历史的取中位数),
+    同分按握手延迟 (初筛结果) 从低到高"""
+    history = {}
+    for candidate in candidates:
+        row = store.get_score(candidate['ip'], candidate['port'])
+        if row is not None and row['score'] > 0:
+            history[(candidate['ip'], int(candidate['port']))] = composite_score(row)
+    values = sorted(history.values())
+    neutral = values[len(values) // 2] if values else 0.0
+
+    def key(candidate):
+        ip_port = (candidate['ip'], int(candidate['port']))
+        return (placements.get(ip_port, len(placements)), -history.get(ip_port, neutral),
+                candidate.get('connect_ms', 0) + candidate.get('tls_ms', 0))
+
+    return sorted(candidates, key=key)
+
+
+def write_atomic(path, lines):
+    """先写临时文件再替换, 读者 (和被中途杀掉的运行) 不会留下写了一半的文件"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(line + '\n')
+    os.replace(tmp_path, path)
+
+
+class Checkpoint:
+    """结果陆续到达时定期调用 write(); 每 CHECKPOINT_EVERY 个结果或 CHECKPOINT_SECONDS 秒写一次"""
+
+    def __init__(self, write, every=CHECKPOINT_EVERY, seconds=CHECKPOINT_SECONDS):
+        self.write = write
+        self.every = every
+        self.seconds = seconds
+        self.pending = 0
+        self.last = time.monotonic()
+
+    def add(self):
+        self.pending += 1
+        if self.pending >= self.every or time.monotonic() - self.last >= self.seconds:
+            self.flush()
+
+    def flush(self):
+        self.write()
+        self.pending = 0
+        self.last = time.monotonic()
@@ -0,0 +1,143 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from run_trace import tracer
+
+# 目标URL列表 (autoip6.py 和 pipeline.py 共用)
+FEED_URLS = [
+    'https://raw.githubusercontent.com/ymyuuu/IPDB/main/BestCF/bestcfv4.txt',
+    'https://raw.githubusercontent.com/rong2er/IP666/refs/heads/main/Ranking.txt',
+    'https://raw.githubusercontent.com/gslege/CloudflareIP/refs/heads/main/SG.txt',
+    'https://raw.githubusercontent.com/gslege/CloudflareIP/refs/heads/main/JP.txt',
+    'https://raw.githubusercontent.com/gslege/CloudflareIP/refs/heads/main/DE.txt',
+    'https://raw.githubusercontent.com/gslege/CloudflareIP/refs/heads/main/NL.txt'
+    #'https://www.wetest.vip/page/cloudflare/address_v6.html',
+    #'https://www.wetest.vip/page/cloudflare/address_v4.html',
+    #'https://cf.090227.xyz',
+    #'https://api.uouin.com/cloudflare.html',
+    #'https://ipdb.api.030101.xyz/?type=bestcf&country=true',
+    #'https://addressesapi.090227.xyz/CloudFlareYes',
+]
+
+# 可用环境变量替换源列表(空白分隔), 用于本地基准测试
+if os.environ.get('AUTOIP6_URLS'):
+    FEED_URLS = os.environ['AUTOIP6_URLS'].split()
+
+# 需要Selenium渲染的动态站点
+DYNAMIC_URLS = {'https://ip.164746.xyz'}
+
+# 每个源的 ETag / Last-Modified 及提取出的 IP 缓存在此(Actions 里由 actions/cache 保留)
+FEED_CACHE_FILE = os.path.join('.cache', 'feeds.json')
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+
+def load_feed_cache(path=FEED_CACHE_FILE):
+    """读取源缓存, 文件不存在或损坏时返回空字典"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_feed_cache(cache, path=FEED_CACHE_FILE):
+    """原子写入源缓存(先写临时文件再替换, 避免中途被杀留下半个文件)"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def make_session(pool_size):
+    """共享连接池的Session, 所有源(多数同在raw.githubusercontent.com)复用连接"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+def _counted(chunks, result):
+    """透传数据块并累计字节数, 以及等待网络数据的秒数(其余时间花在提取上)"""
+    waited = time.perf_counter()
+    for chunk in chunks:
+        result['bytes'] += len(chunk)
+        result['transfer'] += time.perf_counter() - waited
+        yield chunk
+        waited = time.perf_counter()
+    result['transfer'] += time.perf_counter() - waited
+
+
+def fetch_feed(session, url, entry, extract, timeout=7):
+    """条件GET单个源; 304时直接复用缓存的IP, 200时把正文数据块流式交给extract(chunks)提取"""
+    started = time.monotonic()
+    # 随机化URL避免缓存(仅针对频繁更新且不支持条件请求的站点)
+    request_url = f"{url}?t={int(time.time())}" if 'wetest.vip' in url else url
+    headers = {}
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    result = {'url': url, 'status': None, 'ipv4': [], 'ipv6': [], 'bytes': 0, 'entry': entry, 'transfer': 0.0}
+    try:
+        with session.get(request_url, headers=headers, timeout=timeout, stream=True) as response:
+            result['status'] = response.status_code
+            if response.status_code == 304 and 'ipv4' in entry:
+                result['ipv4'] = entry['ipv4']
+                result['ipv6'] = entry.get('ipv6', [])
+            elif response.status_code == 200:
+                # 边下载边提取, 不持有完整正文
+                extract_started = time.perf_counter()
+                ipv4, ipv6 = extract(_counted(response.iter_content(65536), result))
+                tracer.record('fetch.transfer', result['transfer'], url=url, bytes=result['bytes'])
+                tracer.record('fetch.extract', time.perf_counter() - extract_started - result['transfer'], url=url)
+                if result['bytes'] > 100:  # 过滤空内容
+                    result['ipv4'], result['ipv6'] = ipv4, ipv6
+                    result['entry'] = {
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                        'ipv4': ipv4,
+                        'ipv6': ipv6,
+                        'fetched_at': int(time.time()),
+                    }
+    except Exception as e:  # 网络错误不影响其他源
+        result['error'] = str(e)
+        tracer.count('fetch.timeout' if isinstance(e, requests.Timeout) else 'fetch.error')
+    result['elapsed'] = time.monotonic() - started
+    if result['status'] == 304:
+        tracer.count('fetch.not_modified')
+    tracer.record('fetch', result['elapsed'], url=url, status=result['status'], bytes=result['bytes'])
+    return result
+
+
+def fetch_iter(urls, extract, cache, max_workers=None, timeout=7):
+    """并发抓取全部源, 按完成顺序逐个产出结果, 先下载完的源可以先处理; 结果中的新ETag/IP同时写入cache字典"""
+    workers = max_workers or max(1, len(urls))
+    session = make_session(workers)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(fetch_feed, session, url, cache.get(url, {}), extract, timeout) for url in urls]
+            for future in as_completed(futures):
+                result = future.result()
+                if result['status'] in (200, 304) and result['entry']:
+                    cache[result['url']] = result['entry']
+                yield result
+    finally:
+        session.close()
+
+
+def fetch_all(urls, extract, cache_path=FEED_CACHE_FILE, max_workers=None, timeout=7):
+    """并发抓取全部源, 按urls原顺序返回结果, 并把新的ETag/IP写回缓存"""
+    cache = load_feed_cache(cache_path)
+    order = {url: i for i, url in enumerate(urls)}
+    results = sorted(fetch_iter(urls, extract, cache, max_workers, timeout), key=lambda r: order[r['url']])
+    save_feed_cache(cache, cache_path)
+    return results
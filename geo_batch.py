@@ -0,0 +1,196 @@
+import ipaddress
+import json
+import os
+import threading
+import time
+
+import requests
+
+from run_trace import tracer
+
+# ip-api.com 批量接口: 每次最多100个IP, 免费额度每分钟15次批量请求 (地址可用环境变量指向本地替身)
+IP_API_URL = os.environ.get('IP_API_URL', 'http://ip-api.com')
+IP_API_BATCH_URL = f'{IP_API_URL}/batch?fields=status,query,countryCode'
+IP_API_BATCH_PER_MINUTE = float(os.environ.get('IP_API_BATCH_PER_MINUTE', '15'))
+BATCH_SIZE = 100
+
+# ipinfo 兜底接口及其限速(每秒请求数)
+IPINFO_API_URL = os.environ.get('IPINFO_API_URL', 'https://api.ipinfo.io')
+IPINFO_RATE = float(os.environ.get('IPINFO_RATE', '1'))
+
+# 国家码缓存(按IP和按前缀两级), 默认7天过期; Cloudflare任播段基本不会换国家
+GEO_CACHE_FILE = os.path.join('.cache', 'geo.json')
+GEO_CACHE_TTL = 7 * 24 * 3600
+
+
+class TokenBucket:
+    """令牌桶限速: rate为每秒补充的令牌数, capacity为可突发的上限"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """非阻塞取令牌, 成功返回True"""
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        """阻塞直到取到令牌(只在令牌不足时才等待, 不再固定sleep)"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    break
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+        if waited:
+            tracer.record('ratelimit.wait', waited)
+
+
+def ip_prefix(ip):
+    """IPv4取/24, IPv6取/48作为前缀缓存键"""
+    addr = ipaddress.ip_address(ip)
+    prefixlen = 24 if addr.version == 4 else 48
+    return str(ipaddress.ip_network(f'{addr}/{prefixlen}', strict=False))
+
+
+class GeoCache:
+    """磁盘上的国家码缓存, 结构: {'ip': {ip: [code, ts]}, 'prefix': {prefix: [code, ts]}}"""
+
+    def __init__(self, path=GEO_CACHE_FILE, ttl=GEO_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.data = {'ip': {}, 'prefix': {}}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                loaded = json.load(f)
+            self.data['ip'].update(loaded.get('ip', {}))
+            self.data['prefix'].update(loaded.get('prefix', {}))
+        except (OSError, ValueError):
+            pass
+
+    def _fresh(self, record, now):
+        return record is not None and now - record[1] < self.ttl
+
+    def get(self, ip):
+        """先查IP, 再查所在前缀; 过期或没有返回None"""
+        now = time.time()
+        record = self.data['ip'].get(ip)
+        if self._fresh(record, now):
+            return record[0]
+        record = self.data['prefix'].get(ip_prefix(ip))
+        if self._fresh(record, now):
+            return record[0]
+        return None
+
+    def put(self, ip, code):
+        now = int(time.time())
+        self.data['ip'][ip] = [code, now]
+        self.data['prefix'][ip_prefix(ip)] = [code, now]
+
+    def save(self):
+        """丢弃过期条目后原子写回"""
+        now = time.time()
+        for table in self.data.values():
+            for key in [key for key, record in table.items() if not self._fresh(record, now)]:
+                del table[key]
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f)
+        os.replace(tmp_path, self.path)
+
+
+# 免费额度: 每分钟15次批量请求
+ip_api_bucket = TokenBucket(rate=IP_API_BATCH_PER_MINUTE / 60, capacity=IP_API_BATCH_PER_MINUTE)
+
+
+def batch_country_codes(ips, session=None, bucket=ip_api_bucket, timeout=10):
+    """用ip-api批量接口查询国家码, 返回{ip: code}; 失败的IP不在结果中"""
+    session = session or requests
+    codes = {}
+    for i in range(0, len(ips), BATCH_SIZE):
+        chunk = ips[i:i + BATCH_SIZE]
+        bucket.acquire()
+        try:
+            with tracer.span('geo.ip-api.batch', size=len(chunk)) as span:
+                resp = session.post(IP_API_BATCH_URL, json=chunk, timeout=timeout)
+                span.set(status=resp.status_code)
+            if resp.status_code != 200:
+                print(f'ip-api batch failed: status {resp.status_code}')
+                tracer.count('geo.ip-api.failed')
+                continue
+            for item in resp.json():
+                if item.get('status') == 'success' and item.get('countryCode'):
+                    codes[item['query']] = item['countryCode']
+        except Exception as e:
+            print(f'ip-api batch failed: {e}')
+            tracer.count('geo.ip-api.timeout' if isinstance(e, requests.Timeout) else 'geo.ip-api.failed')
+    return codes
+
+
+def ipinfo_country_code(ip):
+    """ipinfo lite 逐个查询国家码(批量接口查不到时兜底), 失败返回'ZZ'"""
+    try:
+        url = f'{IPINFO_API_URL}/lite/{ip}?token=6f75ff6b8f013b'
+        resp = requests.get(url, timeout=5)
+        if resp.status_code == 200:
+            data = resp.json()
+            return data.get('country_code') or data.get('country') or 'ZZ'
+        else:
+            return 'ZZ'
+    except Exception as e:
+        print(f"Failed to query country_code for IP {ip}: {e}")
+        tracer.count('geo.ipinfo.timeout' if isinstance(e, requests.Timeout) else 'geo.ipinfo.failed')
+        return 'ZZ'
+
+
+def lookup_country_codes(ips, fallback=None, cache=None, fallback_bucket=None, index=None):
+    """批量查询国家码: 离线索引 → 缓存命中 → ip-api批量 → fallback(ip)逐个兜底, 返回{ip: code}"""
+    cache = cache or GeoCache()
+    codes = {}
+    missing = []
+    offline_hits = 0
+    for ip in ips:
+        hit = index.lookup(ip) if index is not None else None
+        if hit:
+            offline_hits += 1
+        code = hit[0] if hit else cache.get(ip)
+        if code:
+            codes[ip] = code
+        else:
+            missing.append(ip)
+    tracer.count('geo.offline_hit', offline_hits)
+    tracer.count('geo.cache_hit', len(codes) - offline_hits)
+    print(f'Geo offline/cache hits: {len(codes)}, to query: {len(missing)}')
+    if missing:
+        fetched = batch_country_codes(missing)
+        for ip in missing:
+            code = fetched.get(ip)
+            if code is None and fallback is not None:
+                if fallback_bucket is not None:
+                    fallback_bucket.acquire()
+                tracer.count('geo.fallback')
+                with tracer.span('geo.fallback', ip=ip):
+                    code = fallback(ip)
+            if code and code != 'ZZ':
+                cache.put(ip, code)
+            codes[ip] = code or 'ZZ'
+    cache.save()
+    return codes
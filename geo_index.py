@@ -0,0 +1,279 @@
+"""离线 IP 段 → 国家/城市索引
+
+数据库文件格式(小端):
+    b'GEO1' | 标签数 | 标签JSON长度 | 标签JSON([[国家码, 城市], ...])
+    | IPv4段数 | 起点uint32[] | 终点uint32[] | 标签下标uint32[]
+    | IPv6段数 | 起点高64位[] | 起点低64位[] | 终点高64位[] | 终点低64位[] | 标签下标uint32[]
+
+离线库是可选的: 没有数据库文件时所有查询走远程 API。GitHub Actions 中由 fetch 下载 DB-IP 免费城市库
+(CC BY 4.0, https://db-ip.com) 构建到 .cache/geo.db, 随缓存保留, 超过 30 天才重新下载; 脚本通过环境变量 GEO_DB 找到它。
+
+用法:
+    python geo_index.py build dump.csv geo.db [--country-col 2] [--city-col 3]
+    python geo_index.py fetch .cache/geo.db [--max-age-days 30]
+    python geo_index.py lookup geo.db 104.16.65.1
+"""
+import argparse
+import csv
+import gzip
+import ipaddress
+import json
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_right
+
+GEO_DB_FILE = os.environ.get('GEO_DB', 'geo.db')
+# DB-IP 免费城市库, 每月初发布: 起点,终点,大洲,国家码,省/州,城市,纬度,经度 (无表头)
+DBIP_URL = 'https://download.db-ip.com/free/dbip-city-lite-{month}.csv.gz'
+DBIP_COUNTRY_COL = 3
+DBIP_CITY_COL = 5
+FETCH_MAX_AGE_DAYS = 30
+MAGIC = b'GEO1'
+MASK64 = (1 << 64) - 1
+
+
+def _typed(code, values=()):
+    """固定宽度的array(保证 'I' 为4字节, 'Q' 为8字节)"""
+    arr = array(code, values)
+    assert arr.itemsize == (4 if code == 'I' else 8)
+    return arr
+
+
+class GeoIndex:
+    """排好序的整数数组 + 二分查找, 完全离线"""
+
+    def __init__(self):
+        self.labels = []
+        self.v4_starts = _typed('I')
+        self.v4_ends = _typed('I')
+        self.v4_labels = _typed('I')
+        self.v6_start_hi = _typed('Q')
+        self.v6_start_lo = _typed('Q')
+        self.v6_end_hi = _typed('Q')
+        self.v6_end_lo = _typed('Q')
+        self.v6_labels = _typed('I')
+
+    def __len__(self):
+        return len(self.v4_starts) + len(self.v6_start_hi)
+
+    @classmethod
+    def load(cls, path=GEO_DB_FILE):
+        index = cls()
+        with open(path, 'rb') as f:
+            if f.read(4) != MAGIC:
+                raise ValueError(f'{path} 不是 geo 索引文件')
+            label_count, label_len = struct.unpack('<II', f.read(8))
+            index.labels = [tuple(label) for label in json.loads(f.read(label_len).decode('utf-8'))]
+            assert len(index.labels) == label_count
+            (v4_count,) = struct.unpack('<I', f.read(4))
+            for arr in (index.v4_starts, index.v4_ends, index.v4_labels):
+                arr.fromfile(f, v4_count)
+            (v6_count,) = struct.unpack('<I', f.read(4))
+            for arr in (index.v6_start_hi, index.v6_start_lo, index.v6_end_hi, index.v6_end_lo, index.v6_labels):
+                arr.fromfile(f, v6_count)
+        if sys.byteorder != 'little':
+            for arr in index._arrays():
+                arr.byteswap()
+        return index
+
+    def _arrays(self):
+        return (self.v4_starts, self.v4_ends, self.v4_labels,
+                self.v6_start_hi, self.v6_start_lo, self.v6_end_hi, self.v6_end_lo, self.v6_labels)
+
+    def save(self, path):
+        label_json = json.dumps(self.labels, ensure_ascii=False).encode('utf-8')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<II', len(self.labels), len(label_json)))
+            f.write(label_json)
+            arrays = self._arrays()
+            if sys.byteorder != 'little':
+                arrays = [array(arr.typecode, arr) for arr in arrays]
+                for arr in arrays:
+                    arr.byteswap()
+            f.write(struct.pack('<I', len(self.v4_starts)))
+            for arr in arrays[:3]:
+                arr.tofile(f)
+            f.write(struct.pack('<I', len(self.v6_start_hi)))
+            for arr in arrays[3:]:
+                arr.tofile(f)
+        os.replace(tmp_path, path)
+
+    def _lookup_v4(self, value):
+        pos = bisect_right(self.v4_starts, value) - 1
+        if pos >= 0 and value <= self.v4_ends[pos]:
+            return self.labels[self.v4_labels[pos]]
+        return None
+
+    def _lookup_v6(self, value):
+        hi, lo = value >> 64, value & MASK64
+        # 在(高64位, 低64位)上二分, 找最后一个起点 <= value 的段
+        left, right = 0, len(self.v6_start_hi)
+        while left < right:
+            mid = (left + right) // 2
+            if (self.v6_start_hi[mid], self.v6_start_lo[mid]) <= (hi, lo):
+                left = mid + 1
+            else:
+                right = mid
+        pos = left - 1
+        if pos >= 0 and (hi, lo) <= (self.v6_end_hi[pos], self.v6_end_lo[pos]):
+            return self.labels[self.v6_labels[pos]]
+        return None
+
+    def lookup(self, ip):
+        """返回 (国家码, 城市) 或 None(库中没有该地址)"""
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if addr.version == 4:
+            return self._lookup_v4(int(addr))
+        return self._lookup_v6(int(addr))
+
+
+def _parse_range(start_field, end_field):
+    """支持: CIDR, 文本起止地址, 十进制整数起止地址"""
+    if '/' in start_field:
+        network = ipaddress.ip_network(start_field.strip(), strict=False)
+        return network.version, int(network.network_address), int(network.broadcast_address)
+    if start_field.strip().isdigit():
+        start, end = int(start_field), int(end_field)
+        version = 4 if end <= 0xFFFFFFFF else 6
+        return version, start, end
+    start_addr = ipaddress.ip_address(start_field.strip())
+    end_addr = ipaddress.ip_address(end_field.strip())
+    return start_addr.version, int(start_addr), int(end_addr)
+
+
+def build_index(rows, country_col=2, city_col=3):
+    """由CSV行构建索引; CIDR格式的行没有终点列, 国家/城市列号整体前移一位"""
+    label_ids = {}
+    index = GeoIndex()
+    ranges = {4: [], 6: []}
+    for row in rows:
+        if not row or row[0].startswith('#'):
+            continue
+        try:
+            shift = 1 if '/' in row[0] else 0
+            version, start, end = _parse_range(row[0], row[1] if len(row) > 1 else '')
+        except ValueError:
+            continue  # 表头或无效行
+        country = row[country_col - shift].strip() if len(row) > country_col - shift else ''
+        city = row[city_col - shift].strip() if city_col is not None and len(row) > city_col - shift else ''
+        if not country or country == '-':
+            continue
+        label = (country, city if city != '-' else '')
+        if label not in label_ids:
+            label_ids[label] = len(index.labels)
+            index.labels.append(label)
+        ranges[version].append((start, end, label_ids[label]))
+    for version, items in ranges.items():
+        items.sort()
+        last_end = -1
+        for start, end, label_id in items:
+            if start <= last_end:  # 重叠段保留先出现的
+                continue
+            last_end = end
+            if version == 4:
+                index.v4_starts.append(start)
+                index.v4_ends.append(end)
+                index.v4_labels.append(label_id)
+            else:
+                index.v6_start_hi.append(start >> 64)
+                index.v6_start_lo.append(start & MASK64)
+                index.v6_end_hi.append(end >> 64)
+                index.v6_end_lo.append(end & MASK64)
+                index.v6_labels.append(label_id)
+    return index
+
+
+_default_index = None
+
+
+def load_default_index(path=GEO_DB_FILE):
+    """进程内只加载一次; 没有数据库文件时返回空索引, 所有查询走远程API"""
+    global _default_index
+    if _default_index is None:
+        try:
+            _default_index = GeoIndex.load(path)
+            print(f'已加载离线地理库 {path}: {len(_default_index)} 段')
+        except (OSError, ValueError) as e:
+            print(f'离线地理库不可用 ({e})，全部走远程 API')
+            _default_index = GeoIndex()
+    return _default_index
+
+
+def _recent_months(count=2):
+    """['2026-10', '2026-09']: 月初当月的库可能还没发布, 依次尝试"""
+    year, month = time.gmtime()[:2]
+    months = []
+    for _ in range(count):
+        months.append(f'{year}-{month:02d}')
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return months
+
+
+def fetch_dbip(db_file, max_age_days=FETCH_MAX_AGE_DAYS, url=DBIP_URL):
+    """下载 DB-IP 免费城市库并构建索引; 已有不超过 max_age_days 天的库时跳过。返回 True 表示可用 (新建或已有)
+
+    边下载边解压边解析, 不落地 CSV; 失败时保留旧库 (先写临时文件再替换)。
+    """
+    import requests
+    if os.path.exists(db_file) and time.time() - os.path.getmtime(db_file) < max_age_days * 86400:
+        print(f'{db_file} 未过期, 跳过下载')
+        return True
+    for month in _recent_months():
+        source = url.format(month=month)
+        try:
+            started = time.monotonic()
+            with requests.get(source, stream=True, timeout=60) as resp:
+                resp.raise_for_status()
+                with gzip.open(resp.raw, 'rt', encoding='utf-8', newline='') as f:
+                    index = build_index(csv.reader(f), DBIP_COUNTRY_COL, DBIP_CITY_COL)
+        except (OSError, EOFError, requests.RequestException) as e:
+            print(f'下载 {source} 失败: {e}')
+            continue
+        os.makedirs(os.path.dirname(db_file) or '.', exist_ok=True)
+        index.save(db_file + '.tmp')
+        os.replace(db_file + '.tmp', db_file)
+        print(f'由 {source} 构建 {db_file}: IPv4 {len(index.v4_starts)} 段, IPv6 {len(index.v6_start_hi)} 段'
+              f' ({time.monotonic() - started:.0f}s)')
+        return True
+    return os.path.exists(db_file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='离线 IP 地理索引')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='从CSV构建索引')
+    build.add_argument('csv_file')
+    build.add_argument('db_file', nargs='?', default=GEO_DB_FILE)
+    build.add_argument('--country-col', type=int, default=2, help='国家码所在列(从0开始, 按起止两列格式计)')
+    build.add_argument('--city-col', type=int, default=3, help='城市所在列, -1 表示无城市列')
+    fetch = sub.add_parser('fetch', help='下载 DB-IP 免费城市库并构建索引')
+    fetch.add_argument('db_file', nargs='?', default=GEO_DB_FILE)
+    fetch.add_argument('--max-age-days', type=float, default=FETCH_MAX_AGE_DAYS, help='已有的库不超过这么多天时不重新下载')
+    lookup = sub.add_parser('lookup', help='查询IP')
+    lookup.add_argument('db_file')
+    lookup.add_argument('ips', nargs='+')
+    args = parser.parse_args(argv)
+    if args.command == 'build':
+        with open(args.csv_file, 'r', encoding='utf-8', newline='') as f:
+            index = build_index(csv.reader(f), args.country_col, None if args.city_col < 0 else args.city_col)
+        index.save(args.db_file)
+        print(f'写入 {args.db_file}: IPv4 {len(index.v4_starts)} 段, IPv6 {len(index.v6_start_hi)} 段, 标签 {len(index.labels)} 个')
+    elif args.command == 'fetch':
+        if not fetch_dbip(args.db_file, args.max_age_days):
+            print('离线地理库不可用, 本次查询全部走远程 API')
+    else:
+        index = GeoIndex.load(args.db_file)
+        for ip in args.ips:
+            print(f'{ip}: {index.lookup(ip)}')
+
+
+if __name__ == '__main__':
+    main()
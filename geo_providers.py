@@ -0,0 +1,199 @@
+"""多地理接口调度: 每家独立令牌桶限速 + 熔断, 主接口慢时延迟对冲到下一家, 谁先答用谁
+
+各脚本提供 fetch(ip, timeout) 函数: 返回结果字符串; 接口明确答"未知"时返回 None (换下一家);
+HTTP 429 抛 RateLimited, 其他失败直接抛异常。
+"""
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from geo_batch import TokenBucket
+from run_trace import tracer
+
+# 各接口每分钟请求上限 (免费/demo 额度; 可用环境变量覆盖, 如指向本地替身时放开)
+IP_API_PER_MINUTE = float(os.environ.get('IP_API_PER_MINUTE', '45'))
+IPINFO_PER_MINUTE = float(os.environ.get('IPINFO_PER_MINUTE', '60'))
+IPGEO_PER_MINUTE = float(os.environ.get('IPGEO_PER_MINUTE', '30'))
+
+REQUEST_TIMEOUT = 5
+# 对冲延迟 = 该接口平均延迟 * HEDGE_FACTOR, 限制在 [HEDGE_MIN, HEDGE_MAX] 秒; 还没有样本时用 HEDGE_MAX
+HEDGE_FACTOR = 2.0
+HEDGE_MIN = 0.2
+HEDGE_MAX = 1.0
+LATENCY_ALPHA = 0.2  # 延迟/错误率 EWMA 系数
+
+FAILURE_THRESHOLD = 3  # 连续失败几次后熔断
+COOLDOWN = 60  # 熔断秒数, 半开试探失败后翻倍
+MAX_COOLDOWN = 600
+
+
+class RateLimited(Exception):
+    """接口返回 429; retry_after 为服务端建议的等待秒数"""
+
+    def __init__(self, retry_after=None):
+        super().__init__(f'HTTP 429 (retry after {retry_after})')
+        self.retry_after = retry_after
+
+
+def checked(response):
+    """429 抛 RateLimited, 其他非 200 抛 OSError, 否则原样返回 response"""
+    if response.status_code == 429:
+        retry_after = response.headers.get('Retry-After') or response.headers.get('X-Ttl')  # ip-api 用 X-Ttl
+        raise RateLimited(float(retry_after) if retry_after and retry_after.isdigit() else None)
+    if response.status_code != 200:
+        raise OSError(f'HTTP {response.status_code}')
+    return response
+
+
+class CircuitBreaker:
+    """closed → (连续失败或 429) → open → (冷却结束) → half-open 放行一次试探 → 成功 closed / 失败再 open"""
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial = False  # 半开状态下是否已放出试探请求
+        self.lock = threading.Lock()
+
+    def is_open(self):
+        """只查看状态, 不占用半开试探名额"""
+        with self.lock:
+            return self.open_until != 0.0 and (time.monotonic() < self.open_until or self.trial)
+
+    def allow(self):
+        with self.lock:
+            if self.open_until == 0.0:
+                return True
+            if time.monotonic() < self.open_until or self.trial:
+                return False
+            self.trial = True
+            return True
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.open_until = 0.0
+            self.trial = False
+            self.cooldown = self.base_cooldown
+
+    def failure(self, retry_after=None):
+        """记一次失败; 返回 True 表示本次触发了熔断"""
+        with self.lock:
+            self.failures += 1
+            if retry_after is None and self.failures < self.threshold and not self.trial:
+                return False
+            if self.trial:
+                self.cooldown = min(self.cooldown * 2, MAX_COOLDOWN)
+            self.open_until = time.monotonic() + (retry_after or self.cooldown)
+            self.trial = False
+            return True
+
+
+class Provider:
+    """一家地理接口: fetch 函数 + 限速 + 熔断 + 延迟/错误率统计"""
+
+    def __init__(self, name, fetch, per_minute, timeout=REQUEST_TIMEOUT):
+        self.name = name
+        self.fetch = fetch
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate=per_minute / 60, capacity=max(1.0, per_minute / 60 * 5))
+        self.breaker = CircuitBreaker()
+        self.latency = None  # 成功请求的 EWMA 秒数
+        self.error_rate = 0.0
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """熔断放行且有令牌时返回 True (不阻塞); 先看令牌, 避免占了半开试探名额却发不出请求"""
+        if self.breaker.is_open() or not self.bucket.try_acquire():
+            return False
+        return self.breaker.allow()
+
+    def hedge_delay(self):
+        if self.latency is None:
+            return HEDGE_MAX
+        return min(HEDGE_MAX, max(HEDGE_MIN, self.latency * HEDGE_FACTOR))
+
+    def _observe(self, seconds, failed):
+        with self.lock:
+            if not failed:
+                self.latency = seconds if self.latency is None else (1 - LATENCY_ALPHA) * self.latency + LATENCY_ALPHA * seconds
+            self.error_rate = (1 - LATENCY_ALPHA) * self.error_rate + LATENCY_ALPHA * failed
+
+    def call(self, ip):
+        """调用一次, 异常在此消化; 返回结果或 None"""
+        started = time.monotonic()
+        try:
+            with tracer.span(f'geo.{self.name}', ip=ip):
+                value = self.fetch(ip, self.timeout)
+        except RateLimited as e:
+            self._observe(time.monotonic() - started, True)
+            self.breaker.failure(e.retry_after or COOLDOWN)
+            tracer.count(f'geo.{self.name}.rate_limited')
+            print(f"  {self.name} 被限速 (429), 暂停调用")
+            return None
+        except Exception as e:
+            self._observe(time.monotonic() - started, True)
+            if self.breaker.failure():
+                tracer.count(f'geo.{self.name}.circuit_open')
+                print(f"  {self.name} 连续失败, 熔断 {self.breaker.cooldown}s: {e}")
+            return None
+        self._observe(time.monotonic() - started, False)
+        self.breaker.success()
+        return value
+
+
+class ProviderScheduler:
+    """按优先顺序查询; 正在等的接口超过对冲延迟还没答, 就并行发给下一家, 取最先得到的有效结果"""
+
+    def __init__(self, providers, max_workers=16):
+        self.providers = providers
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='geo')
+
+    def lookup(self, ip):
+        """返回 (结果, 接口名); 全部失败或答未知时返回 (None, None)"""
+        queue = list(self.providers)
+        pending = {}
+        latest = []
+
+        def launch_next():
+            while queue:
+                provider = queue.pop(0)
+                if provider.try_acquire():
+                    pending[self.pool.submit(provider.call, ip)] = provider
+                    latest[:] = [provider]
+                    return True
+            return False
+
+        if not launch_next():
+            # 所有接口都没令牌: 等第一家未熔断的接口补充令牌, 不跳过这个 IP
+            # (同 Provider.try_acquire: 只查看状态来挑选, 拿到令牌后才对选中的这家占用半开试探名额)
+            provider = next((p for p in self.providers if not p.breaker.is_open()), None)
+            if provider is None:
+                return None, None
+            provider.bucket.acquire()
+            if not provider.breaker.allow():  # 等令牌期间被其他线程熔断或占了试探名额
+                return None, None
+            pending[self.pool.submit(provider.call, ip)] = provider
+            latest[:] = [provider]
+        while pending:
+            timeout = latest[0].hedge_delay() if queue else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if launch_next():
+                    tracer.count('geo.hedge')
+                continue
+            for future in done:
+                provider = pending.pop(future)
+                value = future.result()
+                if value:
+                    return value, provider.name
+            if not pending:
+                launch_next()  # 答未知或失败: 立即换下一家
+        return None, None
+
+    def stats(self):
+        return {p.name: {'latency': p.latency, 'error_rate': round(p.error_rate, 3), 'open': p.breaker.is_open()}
+                for p in self.providers}
@@ -0,0 +1,132 @@
+import ipaddress
+import re
+
+# 单遍扫描: 一个正则找出所有"像IP"的片段(至少两个 . 或 : 分隔), 再手工校验并直接转为整数
+# IPv4 带端口(1.2.3.4:8443)、IPv4 映射的 IPv6(::ffff:1.2.3.4) 都在同一个片段里处理
+_TOKEN = re.compile(r'(?<![0-9A-Za-z])[0-9A-Fa-f]{0,4}(?:[:.][0-9A-Fa-f]{0,4}){2,}')
+_HEX = frozenset('0123456789abcdefABCDEF')
+_TOKEN_CHARS = _HEX | frozenset(':.')
+MAX_TOKEN = 64  # 合法地址(含端口)不会超过这个长度
+
+
+def parse_ipv4(text):
+    """点分十进制转整数, 非法返回 None (与 ipaddress 一样拒绝前导零)"""
+    parts = text.split('.')
+    if len(parts) != 4:
+        return None
+    value = 0
+    for part in parts:
+        if not part or len(part) > 3 or not part.isdigit() or (len(part) > 1 and part[0] == '0'):
+            return None
+        octet = int(part)
+        if octet > 255:
+            return None
+        value = (value << 8) | octet
+    return value
+
+
+def _parse_groups(text):
+    groups = []
+    for group in text.split(':'):
+        if not group or len(group) > 4 or not _HEX.issuperset(group):
+            return None
+        groups.append(int(group, 16))
+    return groups
+
+
+def parse_ipv6(text):
+    """IPv6 文本(含 :: 压缩和末尾内嵌 IPv4)转整数, 非法返回 None"""
+    extra = 0
+    tail_v4 = None
+    if '.' in text:
+        head, _, last = text.rpartition(':')
+        tail_v4 = parse_ipv4(last)
+        if tail_v4 is None or not head:
+            return None
+        # "::ffff:1.2.3.4" → "::ffff"; "::1.2.3.4" 的 head 只剩 ":", 补回 "::"
+        text = head + ':' if head.endswith(':') else head
+        extra = 2
+    if text.count('::') > 1:
+        return None
+    if '::' in text:
+        left, right = text.split('::')
+        left_groups = _parse_groups(left) if left else []
+        right_groups = _parse_groups(right) if right else []
+        if left_groups is None or right_groups is None:
+            return None
+        missing = 8 - extra - len(left_groups) - len(right_groups)
+        if missing < 1:
+            return None
+        groups = left_groups + [0] * missing + right_groups
+    else:
+        groups = _parse_groups(text)
+        if groups is None or len(groups) + extra != 8:
+            return None
+    value = 0
+    for group in groups:
+        value = (value << 16) | group
+    if tail_v4 is not None:
+        value = (value << 32) | tail_v4
+    return value
+
+
+def classify(token):
+    """校验一个候选片段, 返回 (4, int) / (6, int) / None"""
+    token = token.rstrip('.')  # 句末的点
+    if ':' not in token:
+        value = parse_ipv4(token)
+        return (4, value) if value is not None else None
+    value = parse_ipv6(token)
+    if value is not None:
+        return 6, value
+    # IPv4:端口
+    host, _, port = token.rpartition(':')
+    if port.isdigit() and '.' in host and ':' not in host:
+        value = parse_ipv4(host)
+        if value is not None:
+            return 4, value
+    return None
+
+
+def extract_ints(text, ipv4=None, ipv6=None):
+    """扫描一段文本, 把地址整数追加进 ipv4/ipv6 列表并返回"""
+    ipv4 = [] if ipv4 is None else ipv4
+    ipv6 = [] if ipv6 is None else ipv6
+    for token in _TOKEN.findall(text):
+        if len(token) > MAX_TOKEN:
+            continue
+        hit = classify(token)
+        if hit is None:
+            continue
+        (ipv4 if hit[0] == 4 else ipv6).append(hit[1])
+    return ipv4, ipv6
+
+
+def extract_stream(chunks):
+    """按块扫描 (str 或 bytes), 块尾未完的片段带到下一块, 不需要持有完整正文"""
+    ipv4, ipv6 = [], []
+    carry = ''
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('latin-1')  # IP 字符都是 ASCII, latin-1 不会失败
+        text = carry + chunk
+        # 末尾连续的候选字符可能被截断, 留到下一块; 超长的不可能是地址, 直接丢掉
+        cut = len(text)
+        while cut > 0 and text[cut - 1] in _TOKEN_CHARS and len(text) - cut <= MAX_TOKEN:
+            cut -= 1
+        if len(text) - cut > MAX_TOKEN:
+            cut = len(text)
+        extract_ints(text[:cut], ipv4, ipv6)
+        # 多留前一个(非候选)字符, 供下一块的左边界判断
+        carry = text[max(cut - 1, 0):]
+    if len(carry) > 1:
+        extract_ints(carry, ipv4, ipv6)
+    return ipv4, ipv6
+
+
+def ipv4_to_str(value):
+    return f'{value >> 24}.{(value >> 16) & 255}.{(value >> 8) & 255}.{value & 255}'
+
+
+def ipv6_to_str(value):
+    return ipaddress.IPv6Address(value).compressed
@@ -0,0 +1,141 @@
+import ipaddress
+from array import array
+from bisect import bisect_left
+
+from ip_extract import ipv4_to_str, ipv6_to_str, parse_ipv4, parse_ipv6
+
+MASK64 = (1 << 64) - 1
+
+
+def _parse(text, version):
+    """地址字符串或整数转整数, 非法返回 None"""
+    if isinstance(text, int):
+        return text
+    text = text.strip()
+    return parse_ipv4(text) if version == 4 else parse_ipv6(text.lower())
+
+
+def _blocks(values, bits):
+    """有序去重的整数 → 合并相邻地址后的 (网络地址, 前缀长度) 列表"""
+    blocks = []
+    i = 0
+    while i < len(values):
+        start = end = values[i]
+        i += 1
+        while i < len(values) and values[i] == end + 1:
+            end = values[i]
+            i += 1
+        # 连续段拆成最大的对齐块
+        while start <= end:
+            size = start & -start if start else 1 << bits
+            while size > end - start + 1:
+                size >>= 1
+            blocks.append((start, bits - size.bit_length() + 1))
+            start += size
+    return blocks
+
+
+class IPSet:
+    """紧凑的 IP 集合: IPv4 存 uint32 数组, IPv6 存高/低 64 位两个数组
+
+    批量插入只追加, 需要有序/去重时调用 normalize() (排序 + 去重一次完成)。
+    """
+
+    def __init__(self):
+        self.v4 = array('I')
+        self.v6_hi = array('Q')
+        self.v6_lo = array('Q')
+        self.normalized = True
+
+    def __len__(self):
+        self.normalize()
+        return len(self.v4) + len(self.v6_hi)
+
+    def add_v4(self, values):
+        """批量加入 IPv4 (整数或字符串), 非法的跳过"""
+        for value in values:
+            value = _parse(value, 4)
+            if value is not None:
+                self.v4.append(value)
+        self.normalized = False
+
+    def add_v6(self, values):
+        """批量加入 IPv6 (整数或字符串), 非法的跳过"""
+        for value in values:
+            value = _parse(value, 6)
+            if value is not None:
+                self.v6_hi.append(value >> 64)
+                self.v6_lo.append(value & MASK64)
+        self.normalized = False
+
+    def add_network(self, cidr):
+        """加入一个 CIDR 段内的全部地址"""
+        network = ipaddress.ip_network(cidr, strict=False)
+        first = int(network.network_address)
+        values = range(first, first + network.num_addresses)
+        if network.version == 4:
+            self.v4.extend(values)
+            self.normalized = False
+        else:
+            self.add_v6(values)
+
+    def normalize(self):
+        """排序并去重 (数值序, IPv6 也按数值而不是字符串排序)"""
+        if self.normalized:
+            return
+        self.v4 = array('I', sorted(set(self.v4)))
+        v6 = sorted({(hi << 64) | lo for hi, lo in zip(self.v6_hi, self.v6_lo)})
+        self.v6_hi = array('Q', (value >> 64 for value in v6))
+        self.v6_lo = array('Q', (value & MASK64 for value in v6))
+        self.normalized = True
+
+    def _v6_ints(self):
+        return [(hi << 64) | lo for hi, lo in zip(self.v6_hi, self.v6_lo)]
+
+    def __contains__(self, ip):
+        self.normalize()
+        addr = ipaddress.ip_address(ip)
+        if addr.version == 4:
+            arr, value = self.v4, int(addr)
+        else:
+            arr, value = self._v6_ints(), int(addr)
+        pos = bisect_left(arr, value)
+        return pos < len(arr) and arr[pos] == value
+
+    def ipv4_strings(self):
+        self.normalize()
+        return [ipv4_to_str(value) for value in self.v4]
+
+    def ipv6_strings(self):
+        self.normalize()
+        return [ipv6_to_str(value) for value in self._v6_ints()]
+
+    def ipv4_cidrs(self):
+        """相邻 IPv4 合并成的 CIDR 块"""
+        self.normalize()
+        return [f'{ipv4_to_str(start)}/{prefix}' for start, prefix in _blocks(self.v4, 32)]
+
+    def ipv6_cidrs(self):
+        """相邻 IPv6 合并成的 CIDR 块"""
+        self.normalize()
+        return [f'{ipv6_to_str(start)}/{prefix}' for start, prefix in _blocks(self._v6_ints(), 128)]
+
+    @classmethod
+    def from_lines(cls, lines):
+        """每行一个地址或 CIDR (可带 :端口 / #注释), 空行和 # 开头的行忽略"""
+        ipset = cls()
+        for line in lines:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            if line.startswith('['):  # [IPv6]:端口
+                line = line[1:line.index(']')]
+            elif line.count(':') == 1:  # IPv4:端口
+                line = line.split(':', 1)[0]
+            if '/' in line:
+                ipset.add_network(line)
+            elif ':' in line:
+                ipset.add_v6([line])
+            else:
+                ipset.add_v4([line])
+        return ipset
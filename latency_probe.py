@@ -0,0 +1,59 @@
+import http.client
+import os
+
+from cf_client import PinnedClient
+from run_trace import tracer
+
+# 每个 IP 发多少个小请求测往返延迟 (代理流量是交互式的, 延迟和抖动与带宽同样重要)
+LATENCY_SAMPLES = int(os.environ.get('LATENCY_SAMPLES', '10'))
+LATENCY_TIMEOUT = 2  # 单次请求超时秒数, 超时记为丢失
+LATENCY_PATH = '/__down?bytes=0'
+
+# 延迟探测单独用短超时的客户端, 丢包的 IP 不会每个样本等 10 秒
+latency_client = PinnedClient(timeout=LATENCY_TIMEOUT)
+
+
+def percentile(values, fraction):
+    """最近秩百分位 (values 已排序)"""
+    index = max(0, min(len(values) - 1, int(fraction * len(values) + 0.5) - 1))
+    return values[index]
+
+
+def summarize(rtts, attempts):
+    """rtts 为成功样本的毫秒列表 (按发送顺序); 抖动为相邻样本差的平均绝对值 (同 RFC 3550 的思路)
+
+    返回 {'p50': 毫秒, 'p95': 毫秒, 'jitter': 毫秒, 'loss': 失败比例}; 全部失败时延迟为 None
+    """
+    loss = round(1 - len(rtts) / attempts, 3) if attempts else 1.0
+    if not rtts:
+        return {'p50': None, 'p95': None, 'jitter': None, 'loss': loss}
+    ordered = sorted(rtts)
+    diffs = [abs(b - a) for a, b in zip(rtts, rtts[1:])]
+    return {
+        'p50': round(percentile(ordered, 0.5), 1),
+        'p95': round(percentile(ordered, 0.95), 1),
+        'jitter': round(sum(diffs) / len(diffs), 1) if diffs else 0.0,
+        'loss': loss,
+    }
+
+
+def measure_latency(ip, port=443, samples=LATENCY_SAMPLES, client=None):
+    """通过固定 IP 连续发 samples 个空请求 (复用 keep-alive 连接), 以首字节时间作为往返延迟
+
+    握手耗时不计入 (只算请求发出到响应头到达); 失败的样本计入丢失率, 下一个样本换新连接。
+    """
+    client = client or latency_client
+    rtts = []
+    with tracer.span('speed.latency', ip=ip, samples=samples) as span:
+        for _ in range(samples):
+            try:
+                with client.request(ip, port, LATENCY_PATH) as resp:
+                    resp.read()
+                    if resp.status != 200:
+                        raise OSError(f'HTTP {resp.status}')
+                rtts.append(resp.timings['ttfb'] * 1000)
+            except (OSError, http.client.HTTPException) as e:
+                tracer.count('latency.timeout' if isinstance(e, TimeoutError) else 'latency.error')
+        result = summarize(rtts, samples)
+        span.set(**result)
+    return result
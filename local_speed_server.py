@@ -0,0 +1,194 @@
+"""本地 HTTPS 测速端点 (speed.cloudflare.com 的离线替身)
+
+    GET  /__down?bytes=N   返回 N 字节
+    POST /__up             读完请求体 (Content-Length 或 chunked) 后返回 200
+
+用法:
+    python local_speed_server.py --port 8443 --rate 20   # 单连接限速 20MB/s
+    python local_speed_server.py --check                 # 起服务并用 cf_client 自测一遍
+"""
+import argparse
+import os
+import socket
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CHUNK = b'\0' * 65536
+
+
+def make_self_signed_cert(directory, host='speed.cloudflare.com'):
+    """用 openssl 命令生成自签名证书, 返回 (cert, key) 路径"""
+    cert = os.path.join(directory, 'cert.pem')
+    key = os.path.join(directory, 'key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-subj', f'/CN={host}', '-keyout', key, '-out', cert],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+class SpeedHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 支持 keep-alive, 便于测试连接复用
+
+    def log_message(self, format, *args):
+        pass
+
+    def _rate(self):
+        """单连接限速 (字节/秒); 设置了 rate_for 时按客户端连接的目标 IP 决定 (127.x.y.z 都落到本机)"""
+        if self.server.rate_for is not None:
+            return self.server.rate_for(self.connection.getsockname()[0]) * 1048576
+        return self.server.rate_bytes
+
+    def _count(self, key, size):
+        with self.server.counter_lock:
+            self.server.counters[key] += size
+
+    def _throttle(self, sent, started, rate):
+        if rate:
+            ahead = sent / rate - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/__down':
+            self.send_error(404)
+            return
+        size = int(parse_qs(url.query).get('bytes', ['0'])[0])
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        started = time.monotonic()
+        rate = self._rate()
+        sent = 0
+        try:
+            while sent < size:
+                data = CHUNK[:min(len(CHUNK), size - sent)]
+                self.wfile.write(data)
+                sent += len(data)
+                self._throttle(sent, started, rate)
+        except (BrokenPipeError, ConnectionResetError, ssl.SSLError):
+            self.close_connection = True  # 客户端提前停止
+        finally:
+            self._count('bytes_sent', sent)
+
+    def _read(self, remaining):
+        """读取并丢弃 remaining 字节, 逐块产出读到的字节数"""
+        while remaining > 0:
+            data = self.rfile.read(min(65536, remaining))
+            if not data:
+                raise ConnectionResetError('请求体不完整')
+            remaining -= len(data)
+            yield len(data)
+
+    def _body_sizes(self):
+        """按 Content-Length 或 chunked 编码读请求体 (上传测速用 chunked, 可随时结束)"""
+        if self.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+            yield from self._read(int(self.headers.get('Content-Length', '0')))
+            return
+        while True:
+            size = int(self.rfile.readline().split(b';')[0], 16)
+            if size == 0:
+                while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                    pass  # 跳过 trailer
+                return
+            yield from self._read(size)
+            self.rfile.readline()  # 块末尾的 CRLF
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/__up':
+            self.send_error(404)
+            return
+        started = time.monotonic()
+        rate = self._rate()
+        received = 0
+        for size in self._body_sizes():
+            received += size
+            self._throttle(received, started, rate)
+        self._count('bytes_received', received)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class TLSServer(ThreadingHTTPServer):
+    """每个连接在自己的工作线程里做 TLS 握手, 慢客户端不会阻塞 accept"""
+    daemon_threads = True
+
+    def finish_request(self, request, client_address):
+        tls_request = self.tls_context.wrap_socket(request, server_side=True)
+        try:
+            super().finish_request(tls_request, client_address)
+        finally:
+            tls_request.close()
+
+    def handle_error(self, request, client_address):
+        pass  # 初筛/提前停止会大量断开连接, 不打印堆栈
+
+
+class TLSServer6(TLSServer):
+    address_family = socket.AF_INET6
+
+
+def start_server(port=0, rate=None, host='127.0.0.1', rate_for=None):
+    """后台线程启动 HTTPS 服务, 返回 (server, 实际端口)
+
+    rate 为单连接 MB/s 上限; rate_for(目标IP) 返回 MB/s 时按 IP 限速 (需 host='0.0.0.0' 才能接收 127.x.y.z)。
+    host 为 IPv6 地址 (如 '::1') 时监听 IPv6。
+    server.counters 记录收发字节数。
+    """
+    workdir = tempfile.mkdtemp(prefix='speed-server-')
+    cert, key = make_self_signed_cert(workdir)
+    server = (TLSServer6 if ':' in host else TLSServer)((host, port), SpeedHandler)
+    server.rate_bytes = rate * 1048576 if rate else None
+    server.rate_for = rate_for
+    server.counters = {'bytes_sent': 0, 'bytes_received': 0}
+    server.counter_lock = threading.Lock()
+    server.tls_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server.tls_context.load_cert_chain(cert, key)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+def self_check(rate):
+    """用 cf_client 对本地服务做一次下载 + 连接复用检查, 打印分阶段耗时"""
+    from cf_client import PinnedClient
+    server, port = start_server(rate=rate)
+    client = PinnedClient()
+    try:
+        for i in range(2):
+            with client.request('127.0.0.1', port, '/__down?bytes=4194304') as resp:
+                size = len(resp.read())
+            print(f'请求 {i + 1}: HTTP {resp.status}, {size} 字节, 耗时 {resp.timings}')
+    finally:
+        client.close()
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 HTTPS 测速端点')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--rate', type=float, default=None, help='单连接限速 MB/s')
+    parser.add_argument('--check', action='store_true', help='启动后用 cf_client 自测并退出')
+    args = parser.parse_args()
+    if args.check:
+        self_check(args.rate)
+        return
+    server, port = start_server(args.port, args.rate, host='0.0.0.0')
+    print(f'本地测速端点已启动: https://127.0.0.1:{port}/__down?bytes=N')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
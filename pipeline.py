@@ -0,0 +1,227 @@
+"""流水线入口: 采集 → 提取 → 去重 → 国家码 → 握手初筛 → 带宽测速 → 排名输出
+
+各阶段是独立线程, 用有界队列串联: 第一个源下载完, 其中的 IP 就开始握手和测速, 后面的源还在下载;
+下游处理不过来时上游在队列上阻塞, 内存不会无限增长。
+仍写出 ip.txt / ipv6.txt (采集结果, 同 autoip6.py) 和 speed_ip.txt / speed_ipv6.txt (测速排名, 测速过程中定期原子更新;
+本机没有 IPv6 时不测 IPv6, 也不覆盖 speed_ipv6.txt)。
+
+与分开运行两个脚本的区别: 候选是边到边测的, 所以不做子网 UCB 抽样和链路校准,
+测速顺序按握手延迟 (优先队列), 最多实测 PIPELINE_BUDGET 个, 设置了 TIME_BUDGET 时剩余时间不够测一个就停止。动态站点 (Selenium) 仍只由 autoip6.py 采集。
+
+用法:
+    python pipeline.py
+    PIPELINE_BUDGET=100 SPEED_WORKERS=4 python pipeline.py
+"""
+import itertools
+import os
+import queue
+import threading
+import time
+import traceback
+
+from adaptive_speed import TopCutoff
+from deadline import Deadline, write_atomic
+from feed_fetcher import DYNAMIC_URLS, FEED_URLS, fetch_iter, load_feed_cache, save_feed_cache
+from geo_batch import IPINFO_RATE, GeoCache, TokenBucket, ipinfo_country_code, lookup_country_codes
+from geo_index import load_default_index
+from ip_extract import extract_stream, ipv4_to_str, ipv6_to_str
+from ipset import IPSet
+from prescreen import PRESCREEN_TOP_K, endpoint, expand_ports, ip_version, ipv6_available, prescreen
+from result_store import ResultStore, composite_score, metrics_text, speed_floor
+from run_trace import tracer
+from speed_engine import MAX_WORKERS
+from test_speed import MULTI_PORT, PORTS_PER_IP, RESULT_DB, UPLOAD_TEST, get_chinese_city, test_speed
+
+# 最多实测多少个 IP:端口 (默认与分开运行时初筛保留的数量相同)
+PIPELINE_BUDGET = int(os.environ.get('PIPELINE_BUDGET', str(PRESCREEN_TOP_K)))
+BATCH_QUEUE_SIZE = 8  # 阶段之间最多积压的批次数 (一个源一批)
+TEST_QUEUE_SIZE = 256  # 等待测速的候选上限
+OUTPUT_EVERY = 10  # 每得到这么多个测速结果就刷新一次 speed_ip.txt
+PUBLISHED_PORT = os.environ.get('PIPELINE_PORT', '8443')  # ip.txt 中写的端口, 也是测速端口
+
+DONE = None  # 队列结束标记
+
+
+def _extract(chunks):
+    ipv4_ints, ipv6_ints = extract_stream(chunks)
+    return sorted(set(ipv4_ints)), sorted(set(ipv6_ints))
+
+
+class Pipeline:
+    def __init__(self, urls, budget=PIPELINE_BUDGET, workers=MAX_WORKERS):
+        self.urls = urls
+        self.budget = budget
+        self.workers = max(1, workers)
+        self.extracted = queue.Queue(BATCH_QUEUE_SIZE)  # (ipv4整数, ipv6整数)
+        self.fresh = queue.Queue(BATCH_QUEUE_SIZE)  # (新ipv4字符串, 新ipv6字符串)
+        self.located = queue.Queue(BATCH_QUEUE_SIZE)  # [候选]
+        self.screened = queue.PriorityQueue(TEST_QUEUE_SIZE)  # (握手毫秒, 序号, 候选)
+        self.measured = queue.Queue(TEST_QUEUE_SIZE)  # 测速结果
+        self.sequence = itertools.count()
+        self.collected = IPSet()
+        self.codes = {}
+        self.store = ResultStore(RESULT_DB)
+        self.keys = set()  # 本次所有候选 (ip, port), 排名只在其中进行
+        self.cutoffs = {4: TopCutoff(50), 6: TopCutoff(50)}  # 第 50 名的综合评分, IPv4 / IPv6 分别排名
+        self.test_ipv6 = None  # 第一批 IPv6 到达时检查本机连通性
+        self.labels = {}
+        self.tested = 0
+        self.tested_lock = threading.Lock()
+        self.budget_spent = threading.Event()
+        self.started = time.monotonic()
+        self.deadline = Deadline()
+        self.first_result = None
+
+    def _elapsed(self):
+        return time.monotonic() - self.started
+
+    # --- 阶段 1+2: 抓取并提取 (按源完成顺序) ---
+    def fetch(self):
+        try:
+            cache = load_feed_cache()
+            for result in fetch_iter([url for url in self.urls if url not in DYNAMIC_URLS], _extract, cache):
+                if 'error' in result or result['status'] not in (200, 304):
+                    print(f"[抓取] {result['url']} 失败: {result.get('error') or result['status']}")
+                    continue
+                print(f"[抓取 {self._elapsed():.1f}s] {result['url']}: {len(result['ipv4'])} IPv4, {len(result['ipv6'])} IPv6 (HTTP {result['status']})")
+                self.extracted.put((result['ipv4'], result['ipv6']))
+            save_feed_cache(cache)
+        finally:
+            self.extracted.put(DONE)
+
+    # --- 阶段 3: 去重, 只把没见过的 IP 往下传 ---
+    def dedupe(self):
+        seen_v4, seen_v6 = set(), set()
+        try:
+            while (batch := self.extracted.get()) is not DONE:
+                with tracer.span('pipeline.dedupe'):
+                    new_v4 = [value for value in batch[0] if value not in seen_v4]
+                    new_v6 = [value for value in batch[1] if value not in seen_v6]
+                    seen_v4.update(new_v4)
+                    seen_v6.update(new_v6)
+                    self.collected.add_v4(new_v4)
+                    self.collected.add_v6(new_v6)
+                if new_v4 or new_v6:
+                    self.fresh.put(([ipv4_to_str(v) for v in new_v4], [ipv6_to_str(v) for v in new_v6]))
+        finally:
+            self.fresh.put(DONE)
+
+    # --- 阶段 4: 国家码 (离线库 → 缓存 → ip-api 批量 → ipinfo), 全部到齐后写 ip.txt / ipv6.txt ---
+    def locate(self):
+        cache = GeoCache()
+        index = load_default_index()
+        fallback_bucket = TokenBucket(rate=IPINFO_RATE, capacity=5)
+        try:
+            while (batch := self.fresh.get()) is not DONE:
+                ipv4, ipv6 = batch
+                with tracer.span('pipeline.geo', ips=len(ipv4) + len(ipv6)):
+                    self.codes.update(lookup_country_codes(ipv4 + ipv6, fallback=ipinfo_country_code, cache=cache,
+                                                           fallback_bucket=fallback_bucket, index=index))
+                if ipv6 and self.test_ipv6 is None:
+                    self.test_ipv6 = ipv6_available({'ip': ip, 'port': PUBLISHED_PORT} for ip in ipv6)
+                    if not self.test_ipv6:
+                        print("[IPv6] 本机没有可用的 IPv6 连接, 只采集不测速")
+                ips = ipv4 + ipv6 if self.test_ipv6 else ipv4
+                if ips:
+                    self.located.put([{'ip': ip, 'port': PUBLISHED_PORT, 'country': self.codes[ip]} for ip in ips])
+            self.write_collected()
+        finally:
+            self.located.put(DONE)
+
+    def write_collected(self):
+        with tracer.span('stage.write', path='ip.txt'):
+            write_atomic('ip.txt', (f"{ip}:{PUBLISHED_PORT}#{self.codes[ip]}" for ip in self.collected.ipv4_strings()))
+            write_atomic('ipv6.txt', (f"[{ip}]:{PUBLISHED_PORT}#{self.codes[ip]}-IPV6" for ip in self.collected.ipv6_strings()))
+        print(f"[采集完成 {self._elapsed():.1f}s] ip.txt {len(self.collected.v4)} 个, ipv6.txt {len(self.collected.v6_hi)} 个")
+
+    # --- 阶段 5: 握手初筛, 可达的按握手延迟进入优先队列 ---
+    def screen(self):
+        try:
+            while (batch := self.located.get()) is not DONE:
+                if self.budget_spent.is_set():
+                    continue  # 预算已用完, 只排空上游
+                if MULTI_PORT:
+                    batch = expand_ports(batch)
+                self.keys.update((c['ip'], int(c['port'])) for c in batch)
+                due = [c for c in batch if self.store.needs_retest(c['ip'], c['port'], upload=UPLOAD_TEST)]
+                with tracer.span('pipeline.prescreen', candidates=len(due)):
+                    reachable = prescreen(due, top_k=0, per_ip=PORTS_PER_IP if MULTI_PORT else 0)
+                for candidate in reachable:
+                    self.screened.put((candidate['connect_ms'] + candidate['tls_ms'], next(self.sequence), candidate))
+        finally:
+            for _ in range(self.workers):
+                self.screened.put((float('inf'), next(self.sequence), DONE))
+
+    # --- 阶段 6: 带宽测速 (多个工作线程) ---
+    def measure(self):
+        while (candidate := self.screened.get()[2]) is not DONE:
+            with self.tested_lock:
+                if self.tested >= self.budget or not self.deadline.can_start():
+                    self.budget_spent.set()
+                    continue
+                self.tested += 1
+            started = time.monotonic()
+            try:
+                with tracer.span('ip', ip=candidate['ip'], port=candidate['port']) as span:
+                    if candidate['ip'] not in self.labels:
+                        self.labels[candidate['ip']] = get_chinese_city(candidate['ip'])
+                    cutoff = self.cutoffs[ip_version(candidate['ip'])].value()
+                    measurement = test_speed(candidate['ip'], int(candidate['port']), speed_floor(cutoff, upload=UPLOAD_TEST),
+                                             upload_cutoff=speed_floor(cutoff, 'upload', upload=True))
+                    span.set(speed=measurement['speed'], reason=measurement['reason'], upload=measurement['upload'])
+            except Exception as e:
+                print(f"[测速] {endpoint(candidate['ip'], candidate['port'])} 异常: {e}")
+                continue
+            self.deadline.observe(time.monotonic() - started)
+            self.measured.put(dict(candidate, label=self.labels[candidate['ip']], **measurement))
+
+    # --- 阶段 7: 记录历史并定期刷新排名 ---
+    def publish(self):
+        count = 0
+        while (result := self.measured.get()) is not DONE:
+            self.store.record(result['ip'], result['port'], result['label'], result['speed'],
+                              result['bytes'], result['seconds'], result['reason'], latency=result['latency'], upload=result['upload'])
+            self.cutoffs[ip_version(result['ip'])].add(composite_score(self.store.get_score(result['ip'], result['port'])))
+            count += 1
+            if self.first_result is None and result['speed'] > 0:
+                self.first_result = self._elapsed()
+                print(f"[首个测速结果 {self.first_result:.1f}s] {endpoint(result['ip'], result['port'])} {result['speed']}MB/s")
+            if count % OUTPUT_EVERY == 0:
+                self.write_ranked()
+
+    def write_ranked(self):
+        """返回 {文件: 写入条数}"""
+        written = {}
+        for path, version in [('speed_ip.txt', 4)] + ([('speed_ipv6.txt', 6)] if self.test_ipv6 else []):
+            keys = {key for key in self.keys.copy() if ip_version(key[0]) == version}  # 初筛线程可能正在添加
+            top_50 = self.store.ranked(keys, limit=50, best_port=MULTI_PORT)
+            write_atomic(path, (f"{endpoint(row['ip'], row['port'])}#{row['label']} {metrics_text(row)}" for row in top_50))
+            written[path] = len(top_50)
+        return written
+
+    def run(self):
+        # 前 50 门槛只由本次结果抬高: 候选是陆续到达的, 事先不知道哪些历史分数仍在本次候选中
+        stages = [threading.Thread(target=self._guard, args=(stage,), name=stage.__name__)
+                  for stage in (self.fetch, self.dedupe, self.locate, self.screen, self.publish)]
+        workers = [threading.Thread(target=self._guard, args=(self.measure,), name=f'measure-{i}') for i in range(self.workers)]
+        for thread in stages + workers:
+            thread.start()
+        for thread in stages[:4] + workers:
+            thread.join()
+        self.measured.put(DONE)
+        stages[4].join()
+        written = self.write_ranked()
+        self.store.close()
+        print(f"\n完成！共 {self._elapsed():.1f}s, 实测 {self.tested} 个 (预算 {self.budget}), "
+              f"首个结果 {self.first_result or 0:.1f}s, " + ', '.join(f'{path} 写入 {n} 个' for path, n in written.items()))
+
+    def _guard(self, stage):
+        """阶段异常只打印, 各阶段的 finally 会把结束标记传给下游, 流水线不会卡死"""
+        try:
+            stage()
+        except Exception:
+            traceback.print_exc()
+
+
+if __name__ == '__main__':
+    Pipeline(FEED_URLS).run()
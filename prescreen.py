@@ -0,0 +1,114 @@
+import os
+import socket
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cf_client import HOST, PinnedConnection
+from run_trace import tracer
+
+# 初筛: 只做 TCP 连接 + TLS 握手, 按延迟保留最好的 K 个进入带宽测速 (0 表示不截断; 多端口模式下 K 按 IP 计)
+PRESCREEN_TOP_K = int(os.environ.get('PRESCREEN_TOP_K', '60'))
+PRESCREEN_WORKERS = int(os.environ.get('PRESCREEN_WORKERS', '64'))
+PRESCREEN_TIMEOUT = 3
+# IPv6 连通性检查: 先查路由表, 再并发 TCP 连几个 IPv6 候选, 都不通就整体跳过 IPv6 (不逐个超时)
+IPV6_ROUTE_PROBE = '2606:4700:4700::1111'
+IPV6_CHECK_SAMPLES = 8
+IPV6_CHECK_TIMEOUT = 2
+# Cloudflare 代理支持的 HTTPS 端口; 多端口模式下每个 IP 都探测这些端口
+CF_HTTPS_PORTS = (443, 2053, 2083, 2087, 2096, 8443)
+
+
+def probe_handshake(ip, port=443, host=HOST, timeout=PRESCREEN_TIMEOUT):
+    """返回 (TCP连接毫秒, TLS握手毫秒), 不通返回 None"""
+    conn = PinnedConnection(ip, port, host, timeout)
+    try:
+        conn.connect()
+    except (OSError, ssl.SSLError) as e:
+        tracer.count('prescreen.timeout' if isinstance(e, TimeoutError) else 'prescreen.unreachable')
+        return None
+    finally:
+        conn.close()
+    tracer.record('prescreen.connect', conn.timings['connect'], ip=ip)
+    tracer.record('prescreen.tls', conn.timings['tls'], ip=ip)
+    return conn.timings['connect'] * 1000, conn.timings['tls'] * 1000
+
+
+def ip_version(ip):
+    return 6 if ':' in ip else 4
+
+
+def endpoint(ip, port):
+    """IP:端口, IPv6 加方括号"""
+    return f'[{ip}]:{port}' if ip_version(ip) == 6 else f'{ip}:{port}'
+
+
+def ipv6_available(candidates=(), timeout=IPV6_CHECK_TIMEOUT):
+    """本机能否走 IPv6; UDP connect 只查路由不发包, 没有 IPv6 路由时立即返回 False
+
+    有路由时再从 candidates 中均匀取几个并发 TCP 连接, 任一连通即可 (最多耗时 timeout 秒)。
+    """
+    try:
+        with socket.socket(socket.AF_INET6, socket.SOCK_DGRAM) as sock:
+            sock.connect((IPV6_ROUTE_PROBE, 443))
+    except OSError:
+        return False
+    candidates = list(candidates)
+    if not candidates:
+        return True
+    step = max(1, len(candidates) // IPV6_CHECK_SAMPLES)
+    sample = candidates[::step][:IPV6_CHECK_SAMPLES]
+
+    def connects(candidate):
+        try:
+            socket.create_connection((candidate['ip'], int(candidate['port'])), timeout).close()
+            return True
+        except OSError:
+            return False
+
+    with ThreadPoolExecutor(max_workers=len(sample)) as pool:
+        return any(pool.map(connects, sample))
+
+
+def expand_ports(candidates, ports=CF_HTTPS_PORTS):
+    """每个 IP 展开成 ports 中的每个端口各一个候选 (同一 IP 只展开一次), 保留其他字段"""
+    expanded = {}
+    for candidate in candidates:
+        for port in ports:
+            expanded.setdefault((candidate['ip'], str(port)), dict(candidate, port=str(port)))
+    return list(expanded.values())
+
+
+def prescreen(candidates, top_k=PRESCREEN_TOP_K, workers=PRESCREEN_WORKERS, per_ip=0):
+    """高并发握手初筛: 每个候选在自己的 port 上握手, 丢弃不通的, 按 连接+握手 耗时排序后保留前 top_k 个
+
+    per_ip > 0 时 (多端口模式) top_k 按 IP 计: 保留最快端口排前 top_k 的 IP, 每个 IP 最多保留握手最快的 per_ip 个端口,
+    即最多 top_k * per_ip 个候选, 测速的不同 IP 数与单端口模式相同。
+    """
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        timings = list(pool.map(lambda c: probe_handshake(c['ip'], int(c['port'])), candidates))
+    reachable = []
+    for candidate, timing in zip(candidates, timings):
+        if timing is not None:
+            candidate['connect_ms'], candidate['tls_ms'] = timing
+            reachable.append(candidate)
+    reachable.sort(key=lambda c: c['connect_ms'] + c['tls_ms'])
+    if per_ip > 0:
+        ports_kept = {}  # ip -> 已保留端口数, 按最快端口的先后加入
+        kept = []
+        for candidate in reachable:
+            ip = candidate['ip']
+            if ip not in ports_kept:
+                if 0 < top_k <= len(ports_kept):
+                    continue
+                ports_kept[ip] = 0
+            if ports_kept[ip] < per_ip:
+                ports_kept[ip] += 1
+                kept.append(candidate)
+        print(f"握手初筛: {len(candidates)} 个候选, {len(reachable)} 个可达, 保留延迟最低的 {len(ports_kept)} 个 IP"
+              f" 共 {len(kept)} 个 IP:端口 ({time.monotonic() - started:.1f}s)")
+        return kept
+    kept = reachable[:top_k] if top_k > 0 else reachable
+    print(f"握手初筛: {len(candidates)} 个候选, {len(reachable)} 个可达, 保留延迟最低的 {len(kept)} 个 ({time.monotonic() - started:.1f}s)")
+    return kept
@@ -0,0 +1,240 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+
+# 测速历史库 (Actions 里由 actions/cache 保留)
+RESULT_DB_FILE = os.path.join('.cache', 'speed_results.sqlite')
+EWMA_ALPHA = 0.3  # 新样本权重
+STALE_SECONDS = 6 * 3600  # 超过这么久没测的 IP 需要重测
+MAX_CV = 0.3  # 波动系数 (标准差 / 均值) 超过此值需要重测
+MAX_AGE_SECONDS = 24 * 3600  # 超过这么久的分数不再用于排名
+
+# 综合评分 (0~100): 各项先归一化到 0~1 再按权重加权平均, 权重可用环境变量覆盖,
+# 如 SCORE_WEIGHTS='speed=1' 即只按下载带宽排名, 'upload=1' 只按上传 (需 UPLOAD_TEST=1)。参考值处该项得 0.5 分, 越好越接近 1
+# 测速的提前停止也按综合评分: 只有带宽低到其余各项全满分也进不了前 50 时才停 (见 speed_floor),
+# 所以带宽权重越低, 提前停止越少
+SCORE_WEIGHTS = os.environ.get('SCORE_WEIGHTS', 'speed=0.4,upload=0.2,latency=0.3,jitter=0.15,loss=0.15')
+SPEED_REF = 20.0  # MB/s, 下载和上传相同
+LATENCY_REF = 150.0  # p50 毫秒
+JITTER_REF = 20.0  # 毫秒
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    label TEXT,
+    speed REAL NOT NULL,
+    bytes INTEGER,
+    seconds REAL,
+    reason TEXT,
+    tested_at REAL NOT NULL,
+    latency_p50 REAL,
+    latency_p95 REAL,
+    jitter REAL,
+    loss REAL,
+    upload_speed REAL
+);
+CREATE INDEX IF NOT EXISTS idx_measurements_ip ON measurements (ip, port, tested_at);
+CREATE TABLE IF NOT EXISTS scores (
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    label TEXT,
+    score REAL NOT NULL,
+    variance REAL NOT NULL,
+    samples INTEGER NOT NULL,
+    last_speed REAL NOT NULL,
+    last_tested REAL NOT NULL,
+    latency REAL,
+    latency_p95 REAL,
+    jitter REAL,
+    loss REAL,
+    upload REAL,
+    PRIMARY KEY (ip, port)
+);
+'''
+# 旧版本库打开时补上的列
+ADDED_COLUMNS = {
+    'measurements': ('latency_p50', 'latency_p95', 'jitter', 'loss', 'upload_speed'),
+    'scores': ('latency', 'latency_p95', 'jitter', 'loss', 'upload'),
+}
+
+
+def parse_weights(text):
+    """'speed=0.4,latency=0.3' -> {'speed': 0.4, 'latency': 0.3}"""
+    weights = {}
+    for item in text.split(','):
+        name, _, value = item.partition('=')
+        if name.strip() not in ('speed', 'upload', 'latency', 'jitter', 'loss'):
+            raise ValueError(f'SCORE_WEIGHTS 中未知的项: {name.strip()}')
+        weights[name.strip()] = float(value)
+    return weights
+
+
+WEIGHTS = parse_weights(SCORE_WEIGHTS)
+
+
+def composite_score(row, weights=WEIGHTS):
+    """按 scores 表的一行 (带宽和延迟的加权均值) 计算综合评分
+
+    测过延迟但样本全部丢失 (有 loss、没有 latency) 的, 延迟和抖动两项记 0 分;
+    从没测过的项 (旧记录没有延迟, 或没开 UPLOAD_TEST 时的上传) 不参与加权。
+    """
+    parts = {'speed': row['score'] / (row['score'] + SPEED_REF) if row['score'] > 0 else 0.0}
+    if row['upload'] is not None:
+        parts['upload'] = row['upload'] / (row['upload'] + SPEED_REF) if row['upload'] > 0 else 0.0
+    if row['loss'] is not None:
+        parts['loss'] = 1 - row['loss']
+    if row['latency'] is not None:
+        parts['latency'] = LATENCY_REF / (LATENCY_REF + row['latency'])
+        parts['jitter'] = JITTER_REF / (JITTER_REF + row['jitter'])
+    elif row['loss'] is not None:
+        parts['latency'] = parts['jitter'] = 0.0
+    total = sum(weights.get(name, 0) for name in parts)
+    if total <= 0:
+        return 100 * parts['speed']
+    return 100 * sum(weights.get(name, 0) * part for name, part in parts.items()) / total
+
+
+def speed_floor(composite, metric='speed', weights=WEIGHTS, upload=False):
+    """带宽 (metric 为 'speed' 下载或 'upload' 上传) 低于返回值 MB/s 时, 即使其余各项都满分综合评分也到不了 composite
+
+    测速按这个值提前停止, 延迟好、带宽一般但综合评分能进前 50 的 IP 不会被截断; composite <= 0 时返回 0 (不设门槛)。
+    upload 表示本次是否测上传 (UPLOAD_TEST): 不测时 composite_score 不含上传项, 这里也不计它的权重。
+    """
+    weight = weights.get(metric, 0)
+    if composite <= 0 or weight <= 0:
+        return 0.0
+    total = sum(value for name, value in weights.items() if name != 'upload' or upload or metric == 'upload')
+    part = (composite / 100 * total - (total - weight)) / weight  # 该项需要的得分
+    if part <= 0:
+        return 0.0
+    if part >= 1:
+        return float('inf')
+    return SPEED_REF * part / (1 - part)
+
+
+def metrics_text(row):
+    """输出行中 # 标签后面的部分, 如 '12.3MB/s 45ms' 或 '12.3MB/s ↑5.1MB/s 45ms' (测了上传时)"""
+    text = f"{round(row['score'], 1)}MB/s"
+    if row['upload'] is not None:
+        text += f" ↑{round(row['upload'], 1)}MB/s"
+    if row['latency'] is not None:
+        text += f" {round(row['latency'])}ms"
+    return text
+
+
+def _ewma(old, new):
+    """新样本缺失 (没测延迟) 时保留旧值"""
+    if new is None:
+        return old
+    if old is None:
+        return new
+    return old + EWMA_ALPHA * (new - old)
+
+
+class ResultStore:
+    """SQLite 测速历史: 每次测量一行, 每个 IP:端口 一个指数加权分数"""
+
+    def __init__(self, path=RESULT_DB_FILE):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self.lock = threading.Lock()
+
+    def _migrate(self):
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {row['name'] for row in self.conn.execute(f'PRAGMA table_info({table})')}
+            for column in columns:
+                if column not in existing:
+                    self.conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} REAL')
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+    def get_score(self, ip, port):
+        with self.lock:
+            return self.conn.execute('SELECT * FROM scores WHERE ip = ? AND port = ?', (ip, int(port))).fetchone()
+
+    def record(self, ip, port, label, speed, size=None, seconds=None, reason=None, tested_at=None, latency=None, upload=None):
+        """写入一次测量并更新加权分数 (失败记为 0, 分数会逐步衰减)
+
+        latency 为 latency_probe.measure_latency() 的结果, upload 为上传 MB/s (没测时为 None), 也按指数加权累计。
+        """
+        tested_at = tested_at or time.time()
+        latency = latency or {'p50': None, 'p95': None, 'jitter': None, 'loss': None}
+        with self.lock:
+            self.conn.execute(
+                'INSERT INTO measurements (ip, port, label, speed, bytes, seconds, reason, tested_at, latency_p50, latency_p95, jitter, loss, upload_speed)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (ip, int(port), label, speed, size, seconds, reason, tested_at,
+                 latency['p50'], latency['p95'], latency['jitter'], latency['loss'], upload),
+            )
+            row = self.conn.execute('SELECT * FROM scores WHERE ip = ? AND port = ?', (ip, int(port))).fetchone()
+            if row is None:
+                score, variance, samples = speed, 0.0, 1
+                delays = (latency['p50'], latency['p95'], latency['jitter'], latency['loss'], upload)
+            else:
+                # 指数加权均值和方差
+                diff = speed - row['score']
+                score = row['score'] + EWMA_ALPHA * diff
+                variance = (1 - EWMA_ALPHA) * (row['variance'] + EWMA_ALPHA * diff * diff)
+                samples = row['samples'] + 1
+                label = label or row['label']
+                delays = (_ewma(row['latency'], latency['p50']), _ewma(row['latency_p95'], latency['p95']),
+                          _ewma(row['jitter'], latency['jitter']), _ewma(row['loss'], latency['loss']),
+                          _ewma(row['upload'], upload))
+            self.conn.execute(
+                'INSERT OR REPLACE INTO scores (ip, port, label, score, variance, samples, last_speed, last_tested, latency, latency_p95, jitter, loss, upload)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (ip, int(port), label, score, variance, samples, speed, tested_at) + delays,
+            )
+            self.conn.commit()
+
+    def needs_retest(self, ip, port, now=None, upload=False):
+        """新 IP、数据过期或波动过大时返回 True; upload=True 时还没有上传数据的可用 IP 也要重测"""
+        row = self.get_score(ip, port)
+        if row is None:
+            return True
+        now = now or time.time()
+        if now - row['last_tested'] > STALE_SECONDS:
+            return True
+        if row['loss'] is None:
+            return True  # 旧版本只测了带宽, 补测延迟后才能与其他 IP 按综合评分比较
+        if upload and row['upload'] is None and row['score'] > 0:
+            return True
+        if row['score'] <= 0:
+            return row['samples'] < 2  # 首次失败再给一次机会, 一直失败的等过期后再测
+        if row['samples'] < 2:
+            return False
+        return math.sqrt(row['variance']) / row['score'] > MAX_CV
+
+    def ranked(self, keys=None, limit=50, now=None, best_port=False):
+        """按综合评分降序返回仍有效的记录 (dict, 综合评分在 'composite'); keys 为 {(ip, port)} 时只在这些 IP 中排名
+
+        best_port=True 时同一 IP 只保留评分最高的端口 (多端口测速)。
+        """
+        now = now or time.time()
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT * FROM scores WHERE score > 0 AND last_tested >= ?',
+                (now - MAX_AGE_SECONDS,),
+            ).fetchall()
+        if keys is not None:
+            rows = [row for row in rows if (row['ip'], row['port']) in keys]
+        rows = [dict(row, composite=composite_score(row)) for row in rows]
+        rows.sort(key=lambda row: row['composite'], reverse=True)
+        if best_port:
+            best = {}
+            for row in rows:  # 已按评分降序, 每个 IP 第一条即最好的端口
+                best.setdefault(row['ip'], row)
+            rows = list(best.values())
+        return rows[:limit]
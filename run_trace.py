@@ -0,0 +1,165 @@
+"""运行追踪: 按阶段/按 IP 记录耗时区间和计数器, 结束时追加写入 JSONL 并打印汇总表
+
+环境变量 RUN_TRACE=路径 时启用 (如 .cache/trace.jsonl, 每次运行追加, 保留最近 RUN_TRACE_KEEP 次运行的历史,
+文件随 actions/cache 反复保存也不会无限增长);
+未设置时 span() 返回共享的空对象, count()/record() 直接返回, 不影响热路径。
+
+    from run_trace import tracer
+    with tracer.span('fetch', url=url) as span:
+        ...
+        span.set(status=200, bytes=n)
+    tracer.count('geo.fallback')
+    tracer.record('speed.tls', 0.031, ip=ip)   # 已在别处测好的耗时
+
+JSONL 每行一个事件: {"type": "run"|"span"|"summary", ...}, 同一次运行的事件带相同 run_id。
+"""
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+TRACE_FILE = os.environ.get('RUN_TRACE', '')
+TRACE_KEEP_RUNS = int(os.environ.get('RUN_TRACE_KEEP', '20'))  # 文件中保留的运行次数 (含本次), 0 为不限
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'attrs', 'started')
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+            self.tracer.count(f'{self.name}.{exc_type.__name__}')  # 如 geo.ip-api.ReadTimeout
+        self.tracer.record(self.name, seconds, _start=self.started, **self.attrs)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """线程安全的追踪器; path 为空时整体关闭"""
+
+    def __init__(self, path=TRACE_FILE, keep_runs=TRACE_KEEP_RUNS):
+        self.enabled = bool(path)
+        self.path = path
+        self.keep_runs = keep_runs
+        self.stats = {}  # 名称 -> [次数, 总秒数, 最大秒数]
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.file = None
+        if self.enabled:
+            self._start()
+
+    def _start(self):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = time.perf_counter()
+        self.started_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if self.keep_runs > 0:
+            self._trim(self.keep_runs - 1)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self._write({'type': 'run', 'script': os.path.basename(sys.argv[0]), 'argv': sys.argv[1:],
+                     'started_at': self.started_at})
+        atexit.register(self.finish)
+
+    def _trim(self, runs):
+        """只保留文件中最近 runs 次运行的事件 (按 run 事件划分), 先写临时文件再替换"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        starts = [i for i, line in enumerate(lines) if line.startswith('{"type": "run"')]
+        if len(starts) <= runs:
+            return
+        keep = lines[starts[len(starts) - runs]:] if runs > 0 else []
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            f.writelines(keep)
+        os.replace(self.path + '.tmp', self.path)
+
+    def _write(self, event):
+        event['run_id'] = self.run_id
+        self.file.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+    def span(self, name, **attrs):
+        """计时区间 (with 语句), 退出时记录; 异常记为 error 属性并按 名称.异常类型 计数, 然后继续抛出"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, attrs)
+
+    def record(self, name, seconds, _start=None, **attrs):
+        """记录一段已测得的耗时"""
+        if not self.enabled:
+            return
+        start = (_start if _start is not None else time.perf_counter() - seconds) - self.started
+        event = {'type': 'span', 'name': name, 'start': round(start, 6), 'seconds': round(seconds, 6),
+                 'thread': threading.current_thread().name}
+        event.update(attrs)
+        with self.lock:
+            stat = self.stats.setdefault(name, [0, 0.0, 0.0])
+            stat[0] += 1
+            stat[1] += seconds
+            stat[2] = max(stat[2], seconds)
+            if self.file is not None:
+                self._write(event)
+
+    def count(self, name, n=1):
+        """累加计数器 (重试/超时/兜底命中等)"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        return {
+            'stages': {name: {'count': c, 'total': round(t, 3), 'mean': round(t / c, 4), 'max': round(m, 3)}
+                       for name, (c, t, m) in self.stats.items()},
+            'counters': dict(self.counters),
+            'wall_time': round(time.perf_counter() - self.started, 3),
+        }
+
+    def finish(self):
+        """写入汇总事件并打印表格 (进程退出时自动调用, 多次调用只生效一次)"""
+        if not self.enabled or self.file is None:
+            return
+        summary = self.summary()
+        with self.lock:
+            self._write(dict(summary, type='summary'))
+            self.file.close()
+            self.file = None
+        print(f"\n=== 运行追踪 {self.run_id} (总耗时 {summary['wall_time']:.1f}s, 已写入 {self.path}) ===")
+        print(f"{'阶段':<28}{'次数':>8}{'总秒数':>10}{'平均秒':>10}{'最大秒':>10}")
+        for name, stage in sorted(summary['stages'].items(), key=lambda item: -item[1]['total']):
+            print(f"{name:<28}{stage['count']:>8}{stage['total']:>10.2f}{stage['mean']:>10.3f}{stage['max']:>10.2f}")
+        for name, value in sorted(summary['counters'].items()):
+            print(f"{name:<28}{value:>8}")
+
+
+tracer = Tracer()
@@ -0,0 +1,256 @@
+"""分片测速: 多台机器 (如 Actions matrix) 各测一部分候选, 再合并成一份排名
+
+    SHARD=0/4 python test_speed.py ip.txt      # 第 0 片 (共 4 片), 写 speed_part_0.jsonl
+    SHARD=1/4 python test_speed.py ip.txt      # ...各片可在不同机器或同一机器的不同进程中运行
+    python shard.py merge speed_part_*.jsonl    # 合并写出 speed_ip.txt / speed_ipv6.txt / speed_ip.md
+
+分片按 /24 (IPv6 /48) 子网的哈希取模, 与候选列表顺序无关, 列表增删 IP 不会让其他 IP 换片;
+同一子网在同一片里, 子网 UCB 抽样仍然有效。
+各片都额外测几个相同的锚点 IP, 合并时据此校准各机器链路的差异 (带宽按比例, 延迟按差值)。
+"""
+import argparse
+import hashlib
+import json
+import os
+import socket
+import statistics
+import time
+
+from deadline import write_atomic
+from geo_index import load_default_index
+from prescreen import endpoint, ip_version
+from result_store import composite_score, metrics_text
+from subnet_sampler import subnet_of
+
+SHARD = os.environ.get('SHARD', '')  # 'i/N', 空表示不分片
+SHARD_ANCHORS = int(os.environ.get('SHARD_ANCHORS', '3'))  # 每片都测的锚点数
+MIN_SHARED_ANCHORS = 2  # 一片至少有这么多个与其他片共同测到的锚点, 校准才可信
+PARTIAL_FILE = 'speed_part_{index}.jsonl'
+MULTI_PORT = os.environ.get('MULTI_PORT', '') == '1'
+TOP_N = 50
+
+# 部分结果文件中保留的 scores 字段 (合并后按 result_store.composite_score 重新评分)
+ROW_FIELDS = ('ip', 'port', 'label', 'score', 'variance', 'samples', 'last_speed', 'last_tested',
+              'latency', 'latency_p95', 'jitter', 'loss', 'upload')
+
+
+def parse_shard(text=SHARD):
+    """'1/4' -> (1, 4); 空字符串返回 None"""
+    if not text:
+        return None
+    index, _, count = text.partition('/')
+    index, count = int(index), int(count)
+    if not 0 <= index < count:
+        raise ValueError(f'SHARD 应为 i/N 且 0 <= i < N: {text}')
+    return index, count
+
+
+def _hash(text):
+    return int.from_bytes(hashlib.sha1(text.encode()).digest()[:8], 'big')
+
+
+def shard_of(ip, count):
+    return _hash(subnet_of(ip)) % count
+
+
+def pick_anchors(candidates, count=SHARD_ANCHORS):
+    """按 IP:端口 哈希最小选出锚点 (只选 IPv4, 各机器 IPv6 可用性可能不同); 各片输入相同则锚点相同"""
+    keys = sorted(((c['ip'], int(c['port'])) for c in candidates if ip_version(c['ip']) == 4),
+                  key=lambda key: _hash(f'{key[0]}:{key[1]}'))
+    return set(keys[:count])
+
+
+def shard_db_path(path, shard):
+    """各片用自己的历史库, 同一台机器上并行多个进程时不会争抢 SQLite 锁"""
+    stem, ext = os.path.splitext(path)
+    return f'{stem}_shard{shard[0]}of{shard[1]}{ext}'
+
+
+def write_partial(path, shard, rows, measured, anchors):
+    """rows 为 store.ranked() 的记录, measured 为 {(ip, port): 本次测量元数据}"""
+    header = {'type': 'shard', 'shard': shard[0], 'shards': shard[1], 'host': socket.gethostname(),
+              'written_at': time.time(), 'anchors': sorted(f'{ip}:{port}' for ip, port in anchors)}
+    lines = [json.dumps(header, ensure_ascii=False)]
+    for row in rows:
+        key = (row['ip'], row['port'])
+        record = {field: row[field] for field in ROW_FIELDS}
+        record.update(type='row', anchor=key in anchors, measured=measured.get(key))
+        lines.append(json.dumps(record, ensure_ascii=False))
+    write_atomic(path, lines)
+
+
+def load_partial(path):
+    header, rows = None, []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            event = json.loads(line)
+            if event['type'] == 'shard':
+                header = event
+            else:
+                rows.append(event)
+    if header is None:
+        raise ValueError(f'{path} 不是分片结果文件')
+    return header, rows
+
+
+def _anchor_measurements(partials):
+    """本次测到的锚点值: ({锚点: {片号: 带宽}}, {锚点: {片号: 延迟p50}})"""
+    speeds, latencies = {}, {}
+    for header, rows in partials:
+        for row in rows:
+            measured = row['measured']
+            if row['anchor'] and measured and measured['speed'] > 0:
+                key = (row['ip'], row['port'])
+                speeds.setdefault(key, {})[header['shard']] = measured['speed']
+                if measured['latency'] and measured['latency']['p50'] is not None:
+                    latencies.setdefault(key, {})[header['shard']] = measured['latency']['p50']
+    return speeds, latencies
+
+
+def shared_anchors(partials):
+    """{片号: 本片测到且至少还有一片也测到的锚点数}; 少于 MIN_SHARED_ANCHORS 时这一片的校准不可靠"""
+    speeds, _ = _anchor_measurements(partials)
+    return {header['shard']: sum(1 for by_shard in speeds.values() if header['shard'] in by_shard and len(by_shard) > 1)
+            for header, _ in partials}
+
+
+def calibrate(partials):
+    """按锚点计算各片的校准: {片号: (带宽系数, 延迟偏移毫秒)}
+
+    每个锚点取各片本次测得值的中位数为参考, 一片的系数 = 各锚点 参考/本片 的中位数; 没有共同锚点时不校准。
+    """
+    speeds, latencies = _anchor_measurements(partials)
+    adjustments = {}
+    for header, _ in partials:
+        shard = header['shard']
+        ratios = [statistics.median(by_shard.values()) / by_shard[shard]
+                  for by_shard in speeds.values() if shard in by_shard and len(by_shard) > 1]
+        offsets = [statistics.median(by_shard.values()) - by_shard[shard]
+                   for by_shard in latencies.values() if shard in by_shard and len(by_shard) > 1]
+        adjustments[shard] = (statistics.median(ratios) if ratios else 1.0,
+                              statistics.median(offsets) if offsets else 0.0)
+    return adjustments
+
+
+def _weighted(values):
+    """[(值, 权重)] 的加权平均, 忽略 None"""
+    values = [(value, weight) for value, weight in values if value is not None]
+    if not values:
+        return None
+    return sum(value * weight for value, weight in values) / sum(weight for _, weight in values)
+
+
+def merge(partials):
+    """校准后合并各片记录; 同一 IP:端口 出现在多片中 (锚点或分片数变化) 时按样本数加权平均"""
+    adjustments = calibrate(partials)
+    grouped = {}
+    for header, rows in partials:
+        factor, offset = adjustments[header['shard']]
+        for row in rows:
+            adjusted = dict(row, shards=[header['shard']])
+            adjusted['score'] = row['score'] * factor
+            adjusted['last_speed'] = row['last_speed'] * factor
+            if row['upload'] is not None:
+                adjusted['upload'] = row['upload'] * factor
+            if row['latency'] is not None:
+                adjusted['latency'] = max(0.0, row['latency'] + offset)
+                adjusted['latency_p95'] = max(0.0, row['latency_p95'] + offset)
+            grouped.setdefault((row['ip'], row['port']), []).append(adjusted)
+    merged = []
+    for copies in grouped.values():
+        row = dict(copies[0])
+        if len(copies) > 1:
+            for field in ('score', 'last_speed', 'upload', 'latency', 'latency_p95', 'jitter', 'loss'):
+                row[field] = _weighted((copy[field], copy['samples']) for copy in copies)
+            row['samples'] = sum(copy['samples'] for copy in copies)
+            row['last_tested'] = max(copy['last_tested'] for copy in copies)
+            row['label'] = next((copy['label'] for copy in copies if copy['label'] not in (None, '未知')), row['label'])
+            row['shards'] = sorted(shard for copy in copies for shard in copy['shards'])
+        row['composite'] = composite_score(row)
+        merged.append(row)
+    merged.sort(key=lambda row: row['composite'], reverse=True)
+    return merged, adjustments
+
+
+def top_rows(rows, version, best_port=MULTI_PORT, limit=TOP_N):
+    rows = [row for row in rows if ip_version(row['ip']) == version and row['score'] > 0]
+    if best_port:
+        best = {}
+        for row in rows:  # 已按评分降序
+            best.setdefault(row['ip'], row)
+        rows = list(best.values())
+    return rows[:limit]
+
+
+def _flag(ip):
+    """离线库有国家码时返回国旗图片的 Markdown"""
+    hit = load_default_index().lookup(ip)
+    return f" ![国旗](https://flagcdn.com/w20/{hit[0].lower()}.png)" if hit and hit[0] else ''
+
+
+def write_markdown(path, sections, partials, adjustments):
+    total = sum(len(rows) for _, rows in partials)
+    lines = [
+        '# IP 测速结果 (IP:端口#标签 + 国旗图像 + 下载/上传速率 + 延迟，多机分片合并)',
+        '',
+        f"生成时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())} UTC",
+        f"分片: {len(partials)} 个, 记录 {total} 条; 校准: "
+        + ', '.join(f'第 {shard} 片 ×{factor:.2f} / {offset:+.0f}ms' for shard, (factor, offset) in sorted(adjustments.items())),
+    ]
+    for title, rows in sections:
+        lines += ['', f'## {title} (按综合评分降序):', '']
+        for row in rows:
+            lines.append(f"- {endpoint(row['ip'], row['port'])} #{row['label']}{_flag(row['ip'])} + {metrics_text(row)}"
+                         f" (评分 {row['composite']:.1f})")
+    write_atomic(path, lines)
+
+
+def merge_files(paths, best_port=MULTI_PORT, markdown='speed_ip.md'):
+    partials = [load_partial(path) for path in paths]
+    counts = {header['shards'] for header, _ in partials}
+    seen = {header['shard'] for header, _ in partials}
+    if len(counts) > 1:
+        print(f"警告: 分片数不一致 {sorted(counts)}")
+    missing = sorted(set(range(max(counts))) - seen) if counts else []
+    if missing:
+        print(f"警告: 缺少第 {missing} 片, 结果只覆盖部分候选")
+    if len(partials) > 1:
+        for shard, count in sorted(shared_anchors(partials).items()):
+            if count < MIN_SHARED_ANCHORS:
+                print(f"警告: 第 {shard} 片只有 {count} 个与其他片共同测到的锚点, 校准"
+                      + ("不可靠" if count else "未生效 (按 ×1.00 / +0ms 合并)"))
+    merged, adjustments = merge(partials)
+    for shard, (factor, offset) in sorted(adjustments.items()):
+        print(f"第 {shard} 片: 带宽 ×{factor:.2f}, 延迟 {offset:+.1f}ms")
+    sections = []
+    for path, version, title in (('speed_ip.txt', 4, 'IPv4'), ('speed_ipv6.txt', 6, 'IPv6')):
+        rows = top_rows(merged, version, best_port)
+        if version == 6 and not rows:
+            continue  # 各片都没测 IPv6 时不覆盖已有的 speed_ipv6.txt
+        write_atomic(path, (f"{endpoint(row['ip'], row['port'])}#{row['label']} {metrics_text(row)}" for row in rows))
+        sections.append((title, rows))
+        print(f"{path}: {len(rows)} 个")
+    write_markdown(markdown, sections, partials, adjustments)
+    print(f"{markdown} 已更新 (合并 {len(paths)} 个分片, {len(merged)} 个 IP:端口)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='分片测速结果合并')
+    sub = parser.add_subparsers(dest='command', required=True)
+    merge_parser = sub.add_parser('merge', help='合并各片的 speed_part_*.jsonl')
+    merge_parser.add_argument('files', nargs='+')
+    merge_parser.add_argument('--best-port', action='store_true', default=MULTI_PORT, help='每个 IP 只保留最好的端口')
+    merge_parser.add_argument('--markdown', default='speed_ip.md')
+    assign = sub.add_parser('assign', help='查看 IP 属于哪一片')
+    assign.add_argument('shards', type=int)
+    assign.add_argument('ips', nargs='+')
+    args = parser.parse_args(argv)
+    if args.command == 'merge':
+        merge_files(args.files, args.best_port, args.markdown)
+    else:
+        for ip in args.ips:
+            print(f'{ip}: 第 {shard_of(ip, args.shards)} 片 ({subnet_of(ip)})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 同时进行的测速数上限(可用环境变量 SPEED_WORKERS 覆盖), 实际并发由链路容量校准后决定
+MAX_WORKERS = int(os.environ.get('SPEED_WORKERS', '8'))
+# 并发时每路平均速度不低于单路速度的这个比例, 才认为链路没被挤满
+SATURATION_RATIO = 0.8
+
+
+def _run_one(candidate, test_fn, deadline=None):
+    """deadline (deadline.Deadline) 表示剩余时间不够时不开始, 返回 None"""
+    if deadline is not None and not deadline.can_start():
+        return None
+    started = time.monotonic()
+    speed = test_fn(candidate)
+    elapsed = time.monotonic() - started
+    if deadline is not None:
+        deadline.observe(elapsed)
+    return dict(candidate, speed=speed, elapsed=elapsed)
+
+
+def run_batch(candidates, test_fn, workers, deadline=None, on_result=None):
+    """并发执行一批测速, 按完成顺序返回结果 (因时间预算没开始的不在其中); on_result 在调用线程中逐个回调"""
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(_run_one, candidate, test_fn, deadline) for candidate in candidates]
+        for future in as_completed(futures):
+            result = future.result()
+            if result is None:
+                continue
+            print(f" [{result['ip']}] {result['speed']}MB/s ({result['elapsed']:.1f}s)")
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    return results
+
+
+def calibrate_concurrency(candidates, test_fn, max_workers=MAX_WORKERS, deadline=None):
+    """测量本机链路总容量, 决定不会互相挤占带宽的并发数
+
+    先单路测一个可用 IP 得到单路速度 p, 再用 max_workers 路同时测得总吞吐 C。
+    若并发时每路仍能跑到 p 的 SATURATION_RATIO 以上, 说明链路未饱和, 保留结果并用满并发;
+    否则这批结果被挤占失真, 丢弃重测, 并发降为 C * SATURATION_RATIO / p。
+    返回 (并发数, 有效结果, 剩余候选)
+    """
+    remaining = list(candidates)
+    results = []
+    single_speed = 0
+    # 单路基准: 最多尝试3个, 跳过不通的IP
+    for _ in range(3):
+        if not remaining or max_workers <= 1:
+            break
+        batch = run_batch([remaining.pop(0)], test_fn, 1, deadline)
+        if not batch:
+            break  # 时间预算已用完
+        results.append(batch[0])
+        if batch[0]['speed'] > 0:
+            single_speed = batch[0]['speed']
+            break
+    if single_speed <= 0 or not remaining or max_workers <= 1:
+        return max(1, max_workers), results, remaining
+
+    probe, remaining = remaining[:max_workers], remaining[max_workers:]
+    probe_results = run_batch(probe, test_fn, len(probe), deadline)
+    ok = [r['speed'] for r in probe_results if r['speed'] > 0]
+    if not ok:
+        return max_workers, results + probe_results, remaining
+    capacity = sum(ok)
+    per_stream = capacity / len(ok)
+    print(f"链路校准: 单路 {single_speed}MB/s, {len(ok)} 路并发总计 {capacity:.1f}MB/s (每路 {per_stream:.1f}MB/s)")
+    if per_stream >= single_speed * SATURATION_RATIO:
+        return max_workers, results + probe_results, remaining
+    workers = max(1, min(max_workers, int(capacity * SATURATION_RATIO / single_speed)))
+    # 挤占失真的结果不采用, 放回队首按新的并发重测
+    failed = [r for r in probe_results if r['speed'] <= 0]
+    failed_keys = {(r['ip'], int(r['port'])) for r in failed}  # 多端口模式下同一 IP 的各端口是不同候选
+    retest = [c for c in probe if (c['ip'], int(c['port'])) not in failed_keys]
+    return workers, results + failed, retest + remaining
+
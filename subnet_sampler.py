@@ -0,0 +1,126 @@
+import heapq
+import ipaddress
+import math
+import os
+import time
+from collections import OrderedDict, deque
+
+from speed_engine import MAX_WORKERS, calibrate_concurrency, run_batch
+
+# 测速预算: 最多实际测多少个 IP (0 表示全部测, 但仍按子网期望值排序, 让前 50 门槛尽早抬高)
+TEST_BUDGET = int(os.environ.get('TEST_BUDGET', '0'))
+SUBNET_PREFIX = 24  # IPv4 按 /24 分组, IPv6 按 /48
+INITIAL_PER_SUBNET = 1  # 每个子网先测的代表数
+UCB_C = 2.0  # 探索系数, 越大越倾向去测样本少的子网
+PRIOR_WEIGHT = 1.0  # 估计未测 IP 时, 向全局均值收缩的先验样本数
+
+
+def subnet_of(ip, prefix=SUBNET_PREFIX):
+    addr = ipaddress.ip_address(ip)
+    prefixlen = prefix if addr.version == 4 else 48
+    return str(ipaddress.ip_network(f'{addr}/{prefixlen}', strict=False))
+
+
+class SubnetSampler:
+    """按子网分组的 UCB 调度: 先每个子网测几个代表, 剩余预算优先给 均值高 / 不确定性大 的子网"""
+
+    def __init__(self, candidates, prefix=SUBNET_PREFIX):
+        self.arms = OrderedDict()
+        self.arm_of = {}
+        for candidate in candidates:  # 组内保持输入顺序 (初筛延迟低的在前)
+            key = subnet_of(candidate['ip'], prefix)
+            self.arms.setdefault(key, {'pending': deque(), 'speeds': []})['pending'].append(candidate)
+            self.arm_of[candidate['ip']] = key
+
+    def has_pending(self):
+        return any(arm['pending'] for arm in self.arms.values())
+
+    def initial_batch(self, per_subnet=INITIAL_PER_SUBNET):
+        batch = []
+        for arm in self.arms.values():
+            for _ in range(min(per_subnet, len(arm['pending']))):
+                batch.append(arm['pending'].popleft())
+        return batch
+
+    def update(self, results):
+        for result in results:
+            self.arms[self.arm_of[result['ip']]]['speeds'].append(result['speed'])
+
+    def _global_stats(self):
+        speeds = [s for arm in self.arms.values() for s in arm['speeds']]
+        if not speeds:
+            return 0.0, 1.0, 0
+        mean = sum(speeds) / len(speeds)
+        std = math.sqrt(sum((s - mean) ** 2 for s in speeds) / len(speeds)) or 1.0
+        return mean, std, len(speeds)
+
+    def _ucb(self, arm, extra, global_std, total):
+        n = len(arm['speeds']) + extra
+        if not arm['speeds']:
+            return float('inf')
+        mean = sum(arm['speeds']) / len(arm['speeds'])
+        return mean + UCB_C * global_std * math.sqrt(math.log(max(total, 2)) / n)
+
+    def next_batch(self, size):
+        """挑出 size 个待测 IP; 同一批内对已选子网按"多测了一次"重算 UCB, 避免全挤在一个子网"""
+        _, global_std, total = self._global_stats()
+        heap = []
+        for key, arm in self.arms.items():
+            if arm['pending']:
+                heapq.heappush(heap, (-self._ucb(arm, 0, global_std, total), key, 0))
+        batch = []
+        while heap and len(batch) < size:
+            _, key, extra = heapq.heappop(heap)
+            arm = self.arms[key]
+            batch.append(arm['pending'].popleft())
+            if arm['pending']:
+                heapq.heappush(heap, (-self._ucb(arm, extra + 1, global_std, total), key, extra + 1))
+        return batch
+
+    def estimates(self):
+        """未测 IP 的估计速度: 所在子网均值向全局均值收缩, 子网没有样本的不估计"""
+        global_mean, _, _ = self._global_stats()
+        estimates = []
+        for key, arm in self.arms.items():
+            if not arm['speeds']:
+                continue
+            n = len(arm['speeds'])
+            estimate = (sum(arm['speeds']) + PRIOR_WEIGHT * global_mean) / (n + PRIOR_WEIGHT)
+            for candidate in arm['pending']:
+                estimates.append(dict(candidate, subnet=key, estimated_speed=round(estimate, 1), samples=n))
+        estimates.sort(key=lambda e: e['estimated_speed'], reverse=True)
+        return estimates
+
+
+def run_sampled(candidates, test_fn, budget=TEST_BUDGET, max_workers=MAX_WORKERS, prefix=SUBNET_PREFIX,
+                deadline=None, on_result=None):
+    """按子网 UCB 分配预算的并发测速, 返回 (结果列表, 总耗时秒, 未测 IP 的估计)
+
+    deadline (deadline.Deadline) 的剩余时间不够再测一个时停止; on_result 对每个被采用的结果回调一次
+    (链路校准中被挤占失真、需要重测的结果不回调)。
+    """
+    started = time.monotonic()
+    budget = budget if budget > 0 else len(candidates)
+    sampler = SubnetSampler(candidates, prefix)
+    first = sampler.initial_batch()
+    for candidate in first[budget:]:  # 预算连代表都测不完时, 多出的放回
+        sampler.arms[sampler.arm_of[candidate['ip']]]['pending'].appendleft(candidate)
+    first = first[:budget]
+    print(f"{len(candidates)} 个候选分布在 {len(sampler.arms)} 个子网, 预算 {budget} 次测速, 先测 {len(first)} 个代表")
+    workers, results, remaining = calibrate_concurrency(first, test_fn, max_workers, deadline)
+    if on_result is not None:
+        for result in results:
+            on_result(result)
+    results.extend(run_batch(remaining, test_fn, workers, deadline, on_result))
+    sampler.update(results)
+    while len(results) < budget and sampler.has_pending() and (deadline is None or deadline.can_start()):
+        batch = sampler.next_batch(min(workers, budget - len(results)))
+        batch_results = run_batch(batch, test_fn, workers, deadline, on_result)
+        sampler.update(batch_results)
+        results.extend(batch_results)
+    wall_time = time.monotonic() - started
+    estimates = sampler.estimates()
+    total_test_time = sum(r['elapsed'] for r in results)
+    print(f"实测 {len(results)} 个, 估计 {len(estimates)} 个未测 IP, 测速总耗时 {wall_time:.1f}s"
+          f" (并发 {workers}, 逐个串行约需 {total_test_time:.1f}s)")
+    return results, wall_time, estimates
@@ -2,17 +2,47 @@ import requests
 import time
 import re
 import os
-import subprocess
+import ipaddress
+import sys
+from geo_index import load_default_index
+from subnet_sampler import run_sampled
+from prescreen import endpoint, expand_ports, ip_version, ipv6_available, prescreen
+from adaptive_speed import TopCutoff, measure_download, measure_upload
+from result_store import ResultStore, composite_score, metrics_text, speed_floor
+from latency_probe import measure_latency
+from ipset import IPSet
+from run_trace import tracer
+from deadline import Checkpoint, Deadline, previous_placements, prioritize, write_atomic
+from shard import PARTIAL_FILE, parse_shard, pick_anchors, shard_db_path, shard_of, write_partial
+from geo_providers import IP_API_PER_MINUTE, IPGEO_PER_MINUTE, IPINFO_PER_MINUTE, Provider, ProviderScheduler, checked
 
-# CF 官方带宽测试端点 (10MB 随机数据)
-TEST_URL = 'https://speed.cloudflare.com/__down?bytes=10485760'  # 10MB
+# CF 官方带宽测试端点 (流式下载，最多 10MB，自适应提前停止)
 HOST = 'speed.cloudflare.com'
-PORT = 443
-FILE_SIZE = 10485760  # 字节，用于验证
 
-# 默认端口
+# 地理接口地址 (可用环境变量指向本地替身, 见 bench_suite.py)
+IP_API_URL = os.environ.get('IP_API_URL', 'http://ip-api.com')
+IPGEO_URL = os.environ.get('IPGEO_URL', 'https://api.ipgeolocation.io')
+IPINFO_URL = os.environ.get('IPINFO_URL', 'https://ipinfo.io')
+
+# 默认端口 (行内没写端口时使用; 测速就在发布的端口上进行)
 DEFAULT_PORT = 8443
 
+# 多端口模式 (MULTI_PORT=1): 每个 IP 同时握手探测全部 Cloudflare HTTPS 端口,
+# 握手最快的 PORTS_PER_IP 个端口进入测速, speed_ip.txt 中每个 IP 只写最快的端口;
+# 初筛的 PRESCREEN_TOP_K 按 IP 计, 测速的 IP 数与单端口模式相同, 带宽测速次数约为 PORTS_PER_IP 倍
+MULTI_PORT = os.environ.get('MULTI_PORT', '') == '1'
+PORTS_PER_IP = int(os.environ.get('PORTS_PER_IP', '2'))
+
+# 上传测速 (UPLOAD_TEST=1): 下载测速成功后再向 __up 流式上传测上行速度;
+# 排名中上传的权重见 result_store.SCORE_WEIGHTS (如 SCORE_WEIGHTS='upload=1' 只按上传排名)
+UPLOAD_TEST = os.environ.get('UPLOAD_TEST', '') == '1'
+
+# ip.txt 中允许的最大 CIDR 段 (/24 = 256 个地址)
+MIN_CIDR_PREFIX = 24
+
+# 测速历史库: 只重测新的/过期的/波动大的 IP，speed_ip.txt 按加权分数生成
+RESULT_DB = os.path.join('.cache', 'speed_results_country.sqlite')
+
 # 国家映射：支持 code (US) 和 full name (United States)
 EN_TO_CN = {
     # Codes
@@ -54,147 +84,258 @@ EN_TO_CN = {
     'Unknown': '未知'
 }
 
+def _country_from_ip_api(ip, timeout):
+    """主: ip-api.com, 优先取国家代码"""
+    data = checked(requests.get(f'{IP_API_URL}/json/{ip}?fields=status,country,countryCode', timeout=timeout)).json()
+    if data['status'] != 'success':
+        return None  # 单个 IP 查不到 (如保留地址, message 为 reserved range), 不是接口故障, 不计入熔断
+    en_country = data.get('countryCode') or data.get('country', 'Unknown')
+    return en_country if en_country != 'Unknown' else None
+
+def _country_from_ipinfo(ip, timeout):
+    """备用1: ipinfo.io (纯文本国家代码)"""
+    en_country = checked(requests.get(f'{IPINFO_URL}/{ip}/country', timeout=timeout)).text.strip()
+    return en_country if en_country and en_country != 'Unknown' else None
+
+def _country_from_ipgeolocation(ip, timeout):
+    """备用2: ipgeolocation.io (demo key)"""
+    data = checked(requests.get(f'{IPGEO_URL}/ipgeo?apiKey=demo&ip={ip}&fields=country_code,country_name', timeout=timeout)).json()
+    en_country = data.get('country_code') or data.get('country_name', 'Unknown')
+    return en_country if en_country != 'Unknown' else None
+
+# 按优先顺序; 主接口慢时对冲到备用, 连续失败或 429 的接口熔断一段时间
+country_providers = ProviderScheduler([
+    Provider('ip-api', _country_from_ip_api, IP_API_PER_MINUTE),
+    Provider('ipinfo', _country_from_ipinfo, IPINFO_PER_MINUTE),
+    Provider('ipgeolocation', _country_from_ipgeolocation, IPGEO_PER_MINUTE),
+])
+
 def get_chinese_country(ip):
-    """查询 IP 国家，并返回中文名（主: ip-api.com；"未知"/失败时备用1: ipinfo.io → 备用2: ipgeolocation.io）"""
-    # 主 API: ip-api.com (HTTP 如前两天)
-    try:
-        response = requests.get(f'http://ip-api.com/json/{ip}?fields=status,country,countryCode', timeout=5)
-        data = response.json()
-        if data['status'] == 'success':
-            en_country = data.get('countryCode') or data.get('country', 'Unknown')  # 优先 code
-            if en_country != 'Unknown':
-                cn_country = EN_TO_CN.get(en_country, en_country)
-                print(f" 国家: {en_country} -> {cn_country}")
-                return cn_country
-            else:
-                print("  ip-api.com 返回 Unknown，尝试备用1: ipinfo.io...")
-        else:
-            print(f"  ip-api.com status fail: {data.get('message', 'Unknown')}，尝试备用1: ipinfo.io...")
-    except Exception as e:
-        print(f"  ip-api.com 查询失败 {ip}: {e}，尝试备用1: ipinfo.io...")
-    
-    # 备用1: ipinfo.io
-    try:
-        backup1_resp = requests.get(f'https://ipinfo.io/{ip}/country', timeout=5)
-        if backup1_resp.status_code == 200:
-            en_country1 = backup1_resp.text.strip()
-            if en_country1 and en_country1 != 'Unknown':
-                cn_country = EN_TO_CN.get(en_country1, en_country1)
-                print(f"  备用1 成功: {en_country1} -> {cn_country}")
-                return cn_country
-            else:
-                print("  ipinfo.io 返回 Unknown，尝试备用2: ipgeolocation.io...")
-        else:
-            print(f"  备用1 失败: {backup1_resp.status_code}，尝试备用2...")
-    except Exception as e:
-        print(f"  备用1 异常: {e}，尝试备用2...")
-    
-    # 备用2: ipgeolocation.io (demo key)
-    try:
-        backup2_resp = requests.get(f'https://api.ipgeolocation.io/ipgeo?apiKey=demo&ip={ip}&fields=country_code,country_name', timeout=5)
-        if backup2_resp.status_code == 200:
-            backup2_data = backup2_resp.json()
-            en_country2 = backup2_data.get('country_code') or backup2_data.get('country_name', 'Unknown')
-            if en_country2 != 'Unknown':
-                cn_country = EN_TO_CN.get(en_country2, en_country2)
-                print(f"  备用2 成功: {en_country2} -> {cn_country}")
-                return cn_country
-            print("  备用2 返回 Unknown")
-        else:
-            print(f"  备用2 失败: {backup2_resp.status_code}")
+    """查询 IP 国家，并返回中文名（离线库优先；未覆盖时 ip-api.com → ipinfo.io → ipgeolocation.io 调度查询）"""
+    # 离线库: 覆盖到时直接返回，不发任何网络请求
+    with tracer.span('geo.offline', ip=ip):
+        hit = load_default_index().lookup(ip)
+    if hit:
+        cn_country = EN_TO_CN.get(hit[0], hit[0])
+        print(f" 国家: {hit[0]} -> {cn_country} (离线库)")
+        return cn_country
+    en_country, provider = country_providers.lookup(ip)
+    if en_country is None:
+        print(f"  {ip} 所有接口均未查到国家")
         return '未知'
+    if provider != 'ip-api':
+        tracer.count('geo.fallback')
+    cn_country = EN_TO_CN.get(en_country, en_country)
+    print(f" 国家: {en_country} -> {cn_country} ({provider})")
+    return cn_country
+
+def test_upload(ip, port, cutoff=0.0, rtt=0.0):
+    """流式上传自适应测速 (MB/s)，失败记为 0；rtt 为往返时间秒数，高延迟链路预热更久"""
+    try:
+        result = measure_upload(ip, port, cutoff, rtt=rtt)
     except Exception as e:
-        print(f"  备用2 异常: {e}")
-        return '未知'
+        print(f" 上传测速失败: {e}")
+        tracer.count('speed.upload_error')
+        return 0.0
+    print(f" 上传 {result['bytes']/1048576:.1f}MB / {result['seconds']}s ({result['reason']}), 速度: {result['speed']}MB/s")
+    return result['speed']
 
-def test_speed(ip, retries=1):
-    """用 curl --resolve 测试 CF 带宽 (MB/s)，重试失败"""
+def test_speed(ip, port, cutoff=0.0, retries=1, upload_cutoff=0.0):
+    """先发若干小请求测往返延迟/抖动/丢失，再流式下载自适应测速 (MB/s)：收敛或确定进不了前 50 即停止，失败重试；
+    UPLOAD_TEST=1 时下载成功后再测上传；返回测量记录"""
+    latency = measure_latency(ip, port)
+    if latency['p50'] is None:
+        print(f" {endpoint(ip, port)} 延迟探测全部失败，跳过下载")
+        return {'speed': 0.0, 'bytes': 0, 'seconds': 0.0, 'reason': 'unreachable', 'latency': latency, 'upload': None}
+    print(f" 延迟: p50 {latency['p50']}ms / p95 {latency['p95']}ms，抖动 {latency['jitter']}ms，丢失 {latency['loss']:.0%}")
+    rtt = latency['p50'] / 1000  # 按往返时间放长慢启动预热，高延迟链路不会在慢启动中就被判为收敛
     for attempt in range(retries + 1):
-        cmd = [
-            'curl', '-s',
-            '--resolve', f'{HOST}:{PORT}:{ip}',
-            TEST_URL,
-            '-o', '/dev/null',
-            '-w', 'speed_download:%{speed_download}\nsize:%{size_download}\n',
-            '--max-time', '30',
-            '--connect-timeout', '10',
-            '--retry', '1',
-            '--insecure'
-        ]
         try:
-            print(f" 测试 {ip}:443 (尝试 {attempt+1})...")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=40)
-            if result.returncode == 0:
-                output = result.stdout.strip()
-                speed_bps = 0
-                downloaded = 0
-                for line in output.split('\n'):
-                    if line.startswith('speed_download:'):
-                        speed_bps = float(line.split(':')[1])
-                    elif line.startswith('size:'):
-                        downloaded = float(line.split(':')[1])
-                if downloaded >= FILE_SIZE * 0.9:
-                    speed_mbps = speed_bps / 1048576
-                    if speed_mbps > 0:
-                        print(f" 成功！下载 {downloaded/1048576:.1f}MB, 速度: {round(speed_mbps, 1)}MB/s")
-                        return round(speed_mbps, 1)
-                print(f" 下载不完整 (code {result.returncode}): {output}")
-                return 0.0
+            print(f" 测试 {ip}:{port} (尝试 {attempt+1})...")
+            result = measure_download(ip, port, cutoff, rtt=rtt)
+            if result['speed'] > 0:
+                print(f" 成功！下载 {result['bytes']/1048576:.1f}MB / {result['seconds']}s ({result['reason']}), 速度: {result['speed']}MB/s")
             else:
-                print(f" curl 失败 (code {result.returncode}): {result.stderr.strip() if result.stderr else 'Timeout'}")
-                if attempt < retries:
-                    time.sleep(2)
-                else:
-                    return 0.0
-        except subprocess.TimeoutExpired:
-            print(f" curl 超时 (30s)")
-            return 0.0
+                print(f" 无有效数据: {result}")
+            result['latency'] = latency
+            result['upload'] = test_upload(ip, port, upload_cutoff, rtt) if UPLOAD_TEST and result['speed'] > 0 else None
+            return result
         except Exception as e:
-            print(f" curl 异常: {e}")
-            return 0.0
-    return 0.0
+            print(f" 测速失败: {e}")
+            tracer.count('speed.timeout' if isinstance(e, TimeoutError) else 'speed.error')
+            if attempt < retries:
+                tracer.count('speed.retry')
+                with tracer.span('speed.retry_wait', ip=ip):
+                    time.sleep(2)
+    return {'speed': 0.0, 'bytes': 0, 'seconds': 0.0, 'reason': 'error', 'latency': latency, 'upload': None}
 
 def main():
     print("=== 脚本开始运行 ===")
+    deadline = Deadline()  # TIME_BUDGET 秒内结束 (从脚本开始计时)
     try:
-        if not os.path.exists('ip.txt'):
-            print("ip.txt 不存在！")
-            return
-        with open('ip.txt', 'r', encoding='utf-8') as f:
-            lines = [line.strip() for line in f if line.strip() and not line.startswith('#') and not line.startswith('-')]
+        # 输入文件: 默认 ip.txt 和 ipv6.txt，可追加 cidr_scan.py 生成的 scan_ip.txt 等
+        input_files = sys.argv[1:] or ['ip.txt', 'ipv6.txt']
+        lines = []
+        for path in input_files:
+            if not os.path.exists(path):
+                print(f"{path} 不存在！")
+                continue
+            with tracer.span('stage.read', path=path), open(path, 'r', encoding='utf-8') as f:
+                lines.extend(line.strip() for line in f if line.strip() and not line.startswith('#') and not line.startswith('-'))
         print(f"读取到 {len(lines)} 个 IP")
         if not lines:
-            print("ip.txt 中无有效 IP！")
+            print(f"{' / '.join(input_files)} 中无有效 IP！")
             return
-        results = []
-        failed_count = 0
+        candidates = {}
         for line in lines:
-            # 提取 IP 和可选端口 (格式: IP:PORT#US 或 IP#US)
-            match = re.match(r'^(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})(?::(\d+))?\s*#(.*)$', line)
+            # IPv6 写成 [地址]:端口#标签 (ipv6.txt 的格式)
+            match = re.match(r'^\[([0-9A-Fa-f:.]+)\](?::(\d+))?\s*#(.*)$', line)
+            if match:
+                try:
+                    ip = str(ipaddress.IPv6Address(match.group(1)))
+                except ValueError:
+                    print(f"跳过无效行: {line}")
+                    continue
+                port = match.group(2) or str(DEFAULT_PORT)
+                candidates.setdefault((ip, port), {'ip': ip, 'port': port})
+                continue
+            # 提取 IP (或 CIDR 段) 和可选端口 (格式: IP:PORT#US、IP#US 或 CIDR:PORT#US)
+            match = re.match(r'^(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}(?:/\d{1,2})?)(?::(\d+))?\s*#(.*)$', line)
             if not match:
                 print(f"跳过无效行: {line}")
                 continue
-            ip = match.group(1)
             port = match.group(2) or str(DEFAULT_PORT)  # 优先自带端口，没有默认8443
-            ip_port = f"{ip}:{port}"
-            cn_country = get_chinese_country(ip)
-            print(f"\n测试 {ip_port} - {cn_country}")
-            speed = test_speed(ip)
-            time.sleep(1)  # 如前两天
-            if speed > 0:
-                result = f"{ip_port}#{cn_country} {speed}MB/s"  # 格式: IP:端口#国家 速率
+            if '/' in match.group(1):
+                if int(match.group(1).split('/')[1]) < MIN_CIDR_PREFIX:
+                    print(f"跳过过大的网段: {line}")
+                    continue
+                ips = IPSet.from_lines([match.group(1)]).ipv4_strings()
+            else:
+                ips = [match.group(1)]
+            for ip in ips:
+                candidates.setdefault((ip, port), {'ip': ip, 'port': port})  # 去重
+        candidates = list(candidates.values())
+        if MULTI_PORT:
+            candidates = expand_ports(candidates)
+            print(f"多端口模式: 展开为 {len(candidates)} 个 IP:端口 组合")
+        ipv6_candidates = [c for c in candidates if ip_version(c['ip']) == 6]
+        test_ipv6 = bool(ipv6_candidates) and ipv6_available(ipv6_candidates)
+        if ipv6_candidates and not test_ipv6:
+            # 没有 IPv6 的机器 (如 GitHub Actions) 不测 IPv6, 也不覆盖已有的 speed_ipv6.txt
+            print(f"本机没有可用的 IPv6 连接，跳过 {len(ipv6_candidates)} 个 IPv6 候选")
+            candidates = [c for c in candidates if ip_version(c['ip']) == 4]
+        outputs = [('speed_ip.txt', 4)] + ([('speed_ipv6.txt', 6)] if test_ipv6 else [])
+
+        # 分片模式 (SHARD=i/N): 只测本片的子网和各片共同的锚点，结果写 speed_part_i.jsonl，由 shard.py merge 合并
+        shard = parse_shard()
+        anchors = set()
+        if shard:
+            anchors = pick_anchors(candidates)
+            candidates = [c for c in candidates
+                          if shard_of(c['ip'], shard[1]) == shard[0] or (c['ip'], int(c['port'])) in anchors]
+            print(f"分片 {shard[0]}/{shard[1]}: 本片 {len(candidates)} 个候选 (含 {len(anchors)} 个锚点)")
+
+        store = ResultStore(shard_db_path(RESULT_DB, shard) if shard else RESULT_DB)
+        keys = {(c['ip'], int(c['port'])) for c in candidates}
+        due = [c for c in candidates if store.needs_retest(c['ip'], c['port'], upload=UPLOAD_TEST)
+               or (c['ip'], int(c['port'])) in anchors]  # 锚点每次都测，合并时用于校准各机器
+        print(f"其中 {len(due)} 个是新 IP 或数据过期/波动大，需要测速；其余 {len(candidates) - len(due)} 个沿用历史分数")
+
+        # 初筛: 高并发测 TCP/TLS 握手延迟, 不通的丢弃, 只把最快的 K 个送去 10MB 下载
+        # IPv4 / IPv6 分别初筛、分别排名，互不挤占名额
+        with tracer.span('stage.prescreen', candidates=len(due)):
+            screened = []
+            for version in (4, 6):
+                family = [c for c in due if ip_version(c['ip']) == version and (c['ip'], int(c['port'])) not in anchors]
+                if family:
+                    screened.extend(prescreen(family, per_ip=PORTS_PER_IP if MULTI_PORT else 0))
+            # 锚点不参与前 K 名截断 (否则在本片排不进前 K 的锚点会被丢掉，合并时这一片就无法校准)
+            pinned = [c for c in due if (c['ip'], int(c['port'])) in anchors]
+            if pinned:
+                reachable = prescreen(pinned, top_k=0)
+                if len(reachable) < len(pinned):
+                    print(f"警告: {len(pinned) - len(reachable)} 个锚点握手不通，本片的校准数据会变少")
+                screened.extend(reachable)
+            due = screened
+        # 按期望价值排序 (上次发布的名次、历史综合评分、握手延迟)，时间预算不够时先测最有希望的
+        due = prioritize(due, store, previous_placements(path for path, _ in outputs))
+        due.sort(key=lambda c: (c['ip'], int(c['port'])) not in anchors)  # 锚点最先测，时间预算用完也有校准数据
+
+        # 当前第 50 名的综合评分；带宽低到其余各项全满分也进不了前 50 的 IP 提前停止 (见 result_store.speed_floor)
+        cutoffs = {4: TopCutoff(50), 6: TopCutoff(50)}
+        due_keys = {(c['ip'], int(c['port'])) for c in due}
+        for row in store.ranked(keys - due_keys, limit=None, best_port=MULTI_PORT):
+            cutoffs[ip_version(row['ip'])].add(row['composite'])
+
+        labels = {}  # ip -> 国家
+        def test_candidate(candidate):
+            """在工作线程中: 查国家 + 测速"""
+            with tracer.span('ip', ip=candidate['ip'], port=candidate['port']) as span:
+                if 'cn_country' not in candidate:  # 校准后重测 / 同一 IP 的其他端口不重复查询
+                    if candidate['ip'] not in labels:
+                        labels[candidate['ip']] = get_chinese_country(candidate['ip'])
+                    candidate['cn_country'] = labels[candidate['ip']]
+                cutoff = cutoffs[ip_version(candidate['ip'])].value()
+                measurement = test_speed(candidate['ip'], int(candidate['port']), speed_floor(cutoff, upload=UPLOAD_TEST),
+                                         upload_cutoff=speed_floor(cutoff, 'upload', upload=True))
+                span.set(speed=measurement['speed'], bytes=measurement['bytes'], reason=measurement['reason'], upload=measurement['upload'])
+            candidate.update(bytes=measurement['bytes'], seconds=measurement['seconds'], reason=measurement['reason'],
+                             latency=measurement['latency'], upload=measurement['upload'])
+            return measurement['speed']
+
+        # 按综合评分 (带宽 + 延迟/抖动/丢失的历史加权值，见 result_store.SCORE_WEIGHTS) 降序，取当前候选中的前 50 个
+        # 写入 speed_ip.txt / speed_ipv6.txt (多端口模式下每个 IP 取最快的端口)；先写临时文件再替换，中途被杀也不会留下半个文件
+        measured = {}  # 本次测量的元数据 (分片模式写入部分结果文件)
+        def write_outputs():
+            if shard:
+                path = PARTIAL_FILE.format(index=shard[0])
+                rows = store.ranked(keys, limit=None)
+                with tracer.span('stage.write', path=path, lines=len(rows)):
+                    write_partial(path, shard, rows, measured, anchors)
+                return [f"{len(rows)} 个保存到 {path} (用 python shard.py merge 合并)"]
+            written = []
+            for path, version in outputs:
+                top_50 = store.ranked({k for k in keys if ip_version(k[0]) == version}, limit=50, best_port=MULTI_PORT)
+                with tracer.span('stage.write', path=path, lines=len(top_50)):
+                    write_atomic(path, (f"{endpoint(row['ip'], row['port'])}#{row['label']} {metrics_text(row)}" for row in top_50))  # 格式: IP:端口#国家 速率 延迟
+                written.append(f"{len(top_50)} 个保存到 {path}")
+            return written
+
+        # 结果一到就记入历史库，并定期写出排名 (检查点)，超时或被杀时已发布的仍是有效的排名
+        checkpoint = Checkpoint(write_outputs)
+        def record(r):
+            measured[(r['ip'], int(r['port']))] = {key: r.get(key) for key in ('speed', 'bytes', 'seconds', 'reason', 'latency', 'upload')}
+            store.record(r['ip'], r['port'], r['cn_country'], r['speed'], r.get('bytes'), r.get('seconds'), r.get('reason'),
+                         latency=r.get('latency'), upload=r.get('upload'))
+            # 门槛只用被采用的结果更新 (链路校准中被挤占失真、待重测的速度不计入)
+            cutoffs[ip_version(r['ip'])].add(composite_score(store.get_score(r['ip'], r['port'])))
+            checkpoint.add()
+
+        # 并发测速 (并发数按链路容量自动校准)，预算按子网 UCB 分配给最有希望的 /24，剩余时间不够测一个时停止
+        with tracer.span('stage.speed', candidates=len(due)):
+            tested, wall_time, estimates = run_sampled(due, test_candidate, deadline=deadline, on_result=record)
+        results = []
+        failed_count = 0
+        for r in tested:
+            if r['speed'] > 0:
+                result = f"{endpoint(r['ip'], r['port'])}#{r['cn_country']} {r['speed']}MB/s {round(r['latency']['p50'])}ms"  # 格式: IP:端口#国家 速率 延迟
                 results.append(result)
                 print(f" -> 成功: {result}")
             else:
                 failed_count += 1
-                print(f" -> 失败: 连接不通")
-        # 按速度降序排序，取前 50 个写入 speed_ip.txt
-        sorted_results = sorted(results, key=lambda x: float(re.search(r'(\d+\.?\d*)MB/s', x).group(1)), reverse=True)
-        top_50 = sorted_results[:50]  # 只取前 50
-        with open('speed_ip.txt', 'w', encoding='utf-8') as f:
-            for res in top_50:
-                f.write(res + '\n')
-        print(f"\n完成！共 {len(results)} 个成功 IP，按速度排序后取前 {len(top_50)} 个保存到 speed_ip.txt (失败 {failed_count} 个)")
+                print(f" -> 失败: {endpoint(r['ip'], r['port'])} 连接不通")
+        total_bytes = sum(r.get('bytes', 0) for r in tested)
+        print(f"共下载 {total_bytes/1048576:.1f}MB (固定 10MB 方案需 {len(tested)*10}MB)")
+        if estimates:
+            # 同子网兄弟 IP 的估计速度 (未实测)
+            with open('speed_estimates.txt', 'w', encoding='utf-8') as f:
+                for e in estimates:
+                    f.write(f"{endpoint(e['ip'], e['port'])} ~{e['estimated_speed']}MB/s ({e['subnet']}, {e['samples']} 个样本)\n")
+            print(f"{len(estimates)} 个未测 IP 的估计速度已写入 speed_estimates.txt")
+        written = write_outputs()
+        store.close()
+        skipped = f"，因时间预算未测 {len(due) - len(tested)} 个" if deadline.stopped else ''
+        print(f"\n完成！本次测速 {len(results)} 个成功 (失败 {failed_count} 个，测速耗时 {wall_time:.1f}s{skipped})，按综合评分取前 50：{'，'.join(written)}")
     except Exception as e:
         print(f"脚本异常: {e}")
         import traceback